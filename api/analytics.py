@@ -0,0 +1,89 @@
+""" Подарки и статистика возрастов сразу для нескольких выгрузок.
+
+    Основной процесс читает из базы данных только колонки каждой выгрузки в массивы numpy,
+    а вычисления выполняются пулом из ANALYTICS_WORKERS процессов, по одной выгрузке на задачу.
+    Пул создается в каждом процессе приложения (воркере gunicorn) отдельно. По умолчанию ANALYTICS_WORKERS=0,
+    тогда выгрузки обрабатываются в основном процессе. """
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+
+from api.graph import RelativesGraph
+from api.models import Citizen, Import
+from api.wsgi import db_worker
+
+MAX_IMPORTS = 100
+
+
+def load_import_columns(import_id):
+    """ Возвращает колонки выгрузки для compute_import_stats или None, если выгрузки не существует. """
+    if Import.get_version(import_id) is None:
+        return None
+    town_names, town_codes, birth_dates = Citizen.encode_towns_and_birth_dates(
+        db_worker.execute(Citizen.select_towns_and_birth_dates(import_id)).all())
+    return {'graph': RelativesGraph.load_arrays(import_id),
+            'town_names': town_names, 'town_codes': town_codes, 'birth_dates': birth_dates}
+
+
+def compute_import_stats(import_id, columns, today):
+    """ Выполняется в процессе пула: получает только массивы и возвращает готовые данные ответа. """
+    presents = RelativesGraph.from_arrays(None, *columns['graph']).presents_rows()
+    return {'import_id': import_id,
+            'birthdays': Citizen.presents_rows_to_dict(presents),
+            'age_stat': Citizen.calculate_age_stat_arrays(columns['town_names'], columns['town_codes'],
+                                                          columns['birth_dates'], today)}
+
+
+def run_now(function, *args):
+    """ Выполняет function в текущем процессе и возвращает завершенный Future, как ProcessPoolExecutor.submit. """
+    future = Future()
+    future.set_result(function(*args))
+    return future
+
+
+def get_start_method():
+    """ fork копирует только вызвавший его поток: блокировки, захваченные другими потоками
+        (например, пулом фоновых загрузок), остались бы захваченными в процессах пула.
+        Поэтому fork используется, только пока в процессе один поток, иначе forkserver или spawn. """
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods and threading.active_count() == 1:
+        return 'fork'
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+class Analytics:
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            context = multiprocessing.get_context(get_start_method())
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=context)
+        return self.executor
+
+    def get_stats(self, import_ids):
+        """ Возвращает подарки и статистику возрастов для каждой выгрузки в порядке import_ids
+            или None, если какой-то выгрузки не существует. Колонки следующей выгрузки читаются,
+            пока пул обрабатывает предыдущие. """
+        today = date.today()
+        submit = self.get_executor().submit if self.workers else run_now
+        tasks = []
+        for import_id in import_ids:
+            columns = load_import_columns(import_id)
+            if columns is None:
+                for task in tasks:
+                    task.cancel()
+                return None
+            tasks.append(submit(compute_import_stats, import_id, columns, today))
+        return [task.result() for task in tasks]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+analytics = Analytics(int(os.environ.get('ANALYTICS_WORKERS', 0)))
@@ -0,0 +1,81 @@
+""" ASGI-приложение с асинхронными обработчиками чтения: uvicorn api.asgi:app
+
+    Обработчики используют те же запросы и вычисления, что и api.views, но не занимают процесс
+    на время обращений к базе данных. Загрузку и изменение данных по-прежнему обслуживает api.wsgi. """
+import os
+from datetime import date
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from api.wsgi import db_conn, get_engine_options
+from api.models import Citizen, Import, Presents, Relations
+from api.serializer import serializer
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg',
+                 'postgresql+psycopg2': 'postgresql+asyncpg',
+                 'sqlite': 'sqlite+aiosqlite'}
+
+
+def get_async_url(database_url):
+    """ Заменяет синхронный драйвер в адресе базы данных на асинхронный. """
+    dialect, address = database_url.split('://', 1)
+    return '%s://%s' % (ASYNC_DRIVERS.get(dialect, dialect), address)
+
+
+async_db_conn = os.environ.get('ASYNC_DATABASE_URL', get_async_url(db_conn))
+engine = create_async_engine(async_db_conn, **get_engine_options(async_db_conn))
+
+
+async def get_all_citizens(session, import_id):
+    relatives = Relations.group_relatives(await session.execute(Relations.select_relations(import_id)))
+    citizens = await session.execute(Import.select_citizens(import_id))
+    return [Import.citizen_row_to_dict(row, relatives.get(row[0], [])) for row in citizens]
+
+
+async def count_presents(session, import_id):
+    rows = (await session.execute(Presents.select_presents(import_id))).all()
+    if not rows and (await session.execute(Import.select_version(import_id))).scalar() is None:
+        return None
+    return Citizen.presents_rows_to_dict(rows)
+
+
+async def get_age_stat(session, import_id):
+    """ Результат не кэшируется в процессе: данные меняет другой процесс (api.wsgi), а его изменения
+        видны здесь только через базу данных. """
+    rows = (await session.execute(Citizen.select_towns_and_birth_dates(import_id))).all()
+    return Citizen.calculate_age_stat(rows, date.today())
+
+
+def json_response(data, status_code):
+    return Response(serializer.dumps(data), status_code, media_type='application/json')
+
+
+async def read_response(get_data, import_id):
+    """ Возвращает данные выгрузки в том же формате, что и обработчики api.views. """
+    async with AsyncSession(engine) as session:
+        data = await get_data(session, import_id)
+    if not data:
+        return json_response({}, 400)
+    return json_response({'data': data}, 200)
+
+
+async def handle_citizens_request(request):
+    return await read_response(get_all_citizens, request.path_params['import_id'])
+
+
+async def handle_birthdays_request(request):
+    return await read_response(count_presents, request.path_params['import_id'])
+
+
+async def handle_age_stat_request(request):
+    return await read_response(get_age_stat, request.path_params['import_id'])
+
+
+app = Starlette(routes=[
+    Route('/imports/{import_id:int}/citizens', handle_citizens_request),
+    Route('/imports/{import_id:int}/citizens/birthdays', handle_birthdays_request),
+    Route('/imports/{import_id:int}/towns/stat/percentile/age', handle_age_stat_request),
+])
@@ -0,0 +1,165 @@
+""" Изменение многих citizens одной выгрузки в одной транзакции: PATCH /imports/<import_id>/citizens.
+
+    Все элементы проверяются до любых изменений. Если хотя бы один некорректен, ничего не меняется,
+    а для каждого некорректного элемента возвращается ошибка. Поля citizens меняются пакетными UPDATE
+    (один запрос на каждый набор изменяемых полей), связи добавляются одной пакетной вставкой и удаляются
+    одним DELETE, подарки обновляются одним набором изменений. Элементы применяются в порядке списка,
+    как последовательность отдельных PATCH. Изменяемые citizens и их новые relatives блокируются до чтения
+    связей, прежние relatives - до вычисления изменений подарков, поэтому параллельные PATCH не теряют их. """
+from collections import Counter, defaultdict
+
+from sqlalchemy import bindparam, delete, tuple_, update
+
+from api.models import INSERT_BATCH_SIZE, Citizen, Import, Presents, Relations
+from api.validators import REQUIRED_FIELDS, parse_citizen
+from api.wsgi import db_worker
+
+MAX_ITEMS = 10000
+ITEM_FIELDS = {'citizen_id', 'changes'}
+CHANGE_FIELDS = REQUIRED_FIELDS - {'citizen_id'}
+
+
+def parse_items(items):
+    """ Возвращает список пар (citizen_id, разобранные changes) и список ошибок {"index", "error"}. """
+    parsed, errors, citizen_ids = [], [], set()
+    for index, item in enumerate(items):
+        changes = None
+        if type(item) is not dict or item.keys() != ITEM_FIELDS or type(item['citizen_id']) is not int:
+            error = 'invalid item'
+        elif item['citizen_id'] in citizen_ids:
+            error = 'duplicate citizen_id'
+        else:
+            changes = parse_citizen(item['changes'])
+            error = 'invalid changes' if not changes or changes.keys() - CHANGE_FIELDS else None
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            citizen_ids.add(item['citizen_id'])
+            parsed.append((item['citizen_id'], changes))
+    return parsed, errors
+
+
+def select_relatives(import_id, citizen_ids):
+    """ Возвращает словарь citizen_id -> set relative_id для citizen_ids одним запросом. """
+    table = Relations.__table__
+    relatives = {citizen_id: set() for citizen_id in citizen_ids}
+    for citizen_id, relative_id in db_worker.execute(Relations.select_relations(import_id)
+                                                     .where(table.c.citizen_id.in_(citizen_ids))):
+        relatives[citizen_id].add(relative_id)
+    return relatives
+
+
+def check_citizens(changes, months):
+    """ Возвращает ошибки для элементов с несуществующими citizen или relatives. """
+    errors = []
+    for index, (citizen_id, data) in enumerate(changes):
+        if citizen_id not in months:
+            errors.append({'index': index, 'error': 'citizen not found'})
+        elif citizen_id in data.get('relatives', ()) or set(data.get('relatives', ())) - months.keys():
+            errors.append({'index': index, 'error': 'invalid relatives'})
+    return errors
+
+
+def apply_relatives(changes, relatives):
+    """ Последовательно применяет новые relatives к словарю relatives (citizen_id -> set),
+        в котором есть все изменяемые citizens. Возвращает словарь пар (меньший id, больший id),
+        которые хоть раз менялись, -> [была ли связь до изменений, есть ли она после]. """
+    pairs = dict()
+    for citizen_id, data in changes:
+        if 'relatives' not in data:
+            continue
+        new_relatives = set(data['relatives'])
+        for relative_id in new_relatives ^ relatives[citizen_id]:
+            added = relative_id in new_relatives
+            pair = (min(citizen_id, relative_id), max(citizen_id, relative_id))
+            pairs.setdefault(pair, [not added, not added])[1] = added
+            if relative_id in relatives:
+                relatives[relative_id] ^= {citizen_id}
+        relatives[citizen_id] = new_relatives
+    return pairs
+
+
+def presents_deltas(pairs, old_months, new_months):
+    """ Изменения подарков (month, citizen_id) -> delta для пар {pair: (была связь, есть связь)}. """
+    deltas = Counter()
+    for (first, second), (before, after) in pairs.items():
+        for months, delta, present in ((old_months, -1, before), (new_months, 1, after)):
+            if present:
+                deltas[(months[first], second)] += delta
+                deltas[(months[second], first)] += delta
+    return deltas
+
+
+def update_citizens(import_id, changes):
+    """ Меняет поля citizens пакетными UPDATE, по одному запросу на каждый набор изменяемых полей. """
+    table = Citizen.__table__
+    groups = defaultdict(list)
+    for citizen_id, data in changes:
+        values = {'new_' + key: value for key, value in data.items() if key != 'relatives'}
+        if values:
+            groups[tuple(sorted(values))].append(dict(values, old_citizen_id=citizen_id))
+    for fields, rows in groups.items():
+        statement = update(table) \
+            .where(table.c.import_id == import_id, table.c.citizen_id == bindparam('old_citizen_id')) \
+            .values({field[len('new_'):]: bindparam(field) for field in fields})
+        db_worker.execute_many(statement, rows, INSERT_BATCH_SIZE)
+
+
+def change_relations(import_id, added, removed):
+    """ Добавляет и удаляет связи пар в обе стороны пакетами. """
+    db_worker.insert_many(Relations.__table__, ({'import_id': import_id, 'citizen_id': citizen_id,
+                                                 'relative_id': relative_id}
+                                                for pair in added for citizen_id, relative_id in (pair, pair[::-1])),
+                          INSERT_BATCH_SIZE)
+    removed = [link for pair in removed for link in (pair, pair[::-1])]
+    table = Relations.__table__
+    for start in range(0, len(removed), INSERT_BATCH_SIZE):
+        db_worker.execute(delete(table).where(
+            table.c.import_id == import_id,
+            tuple_(table.c.citizen_id, table.c.relative_id).in_(removed[start:start + INSERT_BATCH_SIZE])))
+
+
+def select_changed_citizens(import_id, citizen_ids):
+    """ Возвращает измененных citizens в порядке citizen_ids двумя запросами. """
+    table = Citizen.__table__
+    relatives = Relations.group_relatives(db_worker.execute(
+        Relations.select_relations(import_id).where(Relations.__table__.c.citizen_id.in_(citizen_ids))))
+    citizens = {row[0]: Import.citizen_row_to_dict(row, relatives.get(row[0], [])) for row in db_worker.execute(
+        Import.select_citizens(import_id).where(table.c.citizen_id.in_(citizen_ids)))}
+    return [citizens[citizen_id] for citizen_id in citizen_ids]
+
+
+def change_citizens(import_id, items):
+    """ Применяет items [{"citizen_id": ..., "changes": {...}}] к выгрузке import_id в одной транзакции.
+        Возвращает (список измененных citizens в порядке items, None) или (None, список ошибок). """
+    changes, errors = parse_items(items)
+    if errors:
+        return None, errors
+    citizen_ids = [citizen_id for citizen_id, _ in changes]
+    months = Citizen.select_months(import_id,
+                                   set(citizen_ids).union(*(data.get('relatives', ()) for _, data in changes)))
+    errors = check_citizens(changes, months)
+    if errors:
+        return None, errors
+
+    new_months = {citizen_id: data['birth_date'].month for citizen_id, data in changes if 'birth_date' in data}
+    moved = {citizen_id for citizen_id, month in new_months.items() if month != months[citizen_id]}
+    relatives = select_relatives(import_id, moved | {citizen_id for citizen_id, data in changes
+                                                     if 'relatives' in data})
+    old_relatives = {citizen_id: set(relative_ids) for citizen_id, relative_ids in relatives.items()}
+    pairs = apply_relatives(changes, relatives)
+    for citizen_id in moved:
+        for relative_id in old_relatives[citizen_id] | relatives[citizen_id]:
+            pairs.setdefault((min(citizen_id, relative_id), max(citizen_id, relative_id)), [True, True])
+    missing = {citizen_id for pair in pairs for citizen_id in pair} - months.keys()
+    if missing:
+        months.update(Citizen.select_months(import_id, missing))
+
+    update_citizens(import_id, changes)
+    change_relations(import_id, [pair for pair, (before, after) in pairs.items() if after and not before],
+                     [pair for pair, (before, after) in pairs.items() if before and not after])
+    Presents.apply_deltas(import_id, presents_deltas(pairs, months, {**months, **new_months}))
+    Import.bump_version(import_id)
+    citizens = select_changed_citizens(import_id, citizen_ids)
+    db_worker.commit()
+    return citizens, None
@@ -0,0 +1,88 @@
+""" Кэш готовых ответов на запросы чтения.
+
+    Ключ ответа включает import_id и версию выгрузки, которая увеличивается при каждом изменении данных,
+    поэтому устаревшие ответы не выдаются и вытесняются сами. Локальное хранилище ограничено
+    суммарным размером ответов в байтах. Дополнительно можно подключить общее для процессов хранилище
+    с методами get(key) и set(key, value), например redis.Redis (RESPONSE_CACHE_REDIS_URL). """
+import os
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUStore:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            old_value = self.items.pop(key, None)
+            if old_value is not None:
+                self.size -= len(old_value)
+            self.items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+
+class ResponseCache:
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def clear(self):
+        self.local.clear()
+        self.hits = self.misses = self.local.evictions = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.local.evictions,
+                'items': len(self.local.items), 'bytes': self.local.size, 'max_bytes': self.local.max_bytes}
+
+
+def get_shared_store(url):
+    if not url:
+        return None
+    import redis
+    return redis.Redis.from_url(url)
+
+
+response_cache = ResponseCache(LRUStore(int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 2 ** 20))),
+                               get_shared_store(os.environ.get('RESPONSE_CACHE_REDIS_URL')))
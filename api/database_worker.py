@@ -1,5 +1,9 @@
+from itertools import islice
+
+
 class DataBaseWorker:
     def __init__(self, db):
+        self.db = db
         self.session = db.session
 
     def commit(self):
@@ -8,5 +12,38 @@ class DataBaseWorker:
     def add(self, object):
         self.session.add(object)
 
+    def delete(self, object):
+        self.session.delete(object)
+
+    def flush(self):
+        self.session.flush()
+
     def rollback(self):
         self.session.rollback()
+
+    def execute(self, statement):
+        """ Выполняет запрос чтения SQLAlchemy Core и возвращает строки без создания объектов ORM.
+            Перед запросами Core Session не сбрасывает несохраненные объекты сама, поэтому это делается явно. """
+        if self.session.autoflush:
+            self.session.flush()
+        return self.session.execute(statement)
+
+    def execute_committed(self, statement):
+        """ Выполняет statement в отдельном соединении и сразу фиксирует его, не затрагивая транзакцию session.
+            Так фоновая задача сообщает о себе другим процессам, пока ее собственная транзакция не завершена. """
+        with self.db.engine.begin() as connection:
+            connection.execute(statement)
+
+    def insert_many(self, table, rows, batch_size):
+        """ Вставляет rows в table пакетами по batch_size строк. rows может быть генератором,
+            тогда в памяти одновременно находится только один пакет.
+            Запрос компилируется один раз, драйвер psycopg2 разворачивает пакет в многострочный INSERT. """
+        self.execute_many(table.insert(), rows, batch_size)
+
+    def execute_many(self, statement, rows, batch_size):
+        """ Выполняет statement с параметрами каждой из rows (executemany) пакетами по batch_size строк. """
+        rows = iter(rows)
+        batch = list(islice(rows, batch_size))
+        while batch:
+            self.session.execute(statement, batch)
+            batch = list(islice(rows, batch_size))
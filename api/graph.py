@@ -0,0 +1,144 @@
+""" Граф родственных связей выгрузки в компактных массивах numpy.
+
+    Граф хранится в формате CSR: citizen_ids отсортированы, связи citizen с позицией i занимают
+    indices[indptr[i]:indptr[i + 1]] (позиции relatives в citizen_ids), месяцы рождения - массив uint8.
+    Граф загружается двумя запросами и помнит версию выгрузки; при изменении выгрузки (PATCH увеличивает версию)
+    он перезагружается при следующем обращении. Включается переменной окружения GRAPH_INDEX=1. """
+import os
+from collections import OrderedDict
+from threading import Lock
+
+import numpy
+from sqlalchemy import extract, select
+
+from api.models import Citizen, Import, Relations
+from api.wsgi import db_worker
+
+
+class RelativesGraph:
+    def __init__(self, version, citizen_ids, months, indptr, indices):
+        self.version = version
+        self.citizen_ids = citizen_ids
+        self.months = months
+        self.indptr = indptr
+        self.indices = indices
+
+    @property
+    def nbytes(self):
+        return self.citizen_ids.nbytes + self.months.nbytes + self.indptr.nbytes + self.indices.nbytes
+
+    @staticmethod
+    def load(import_id, version):
+        return RelativesGraph.from_arrays(version, *RelativesGraph.load_arrays(import_id))
+
+    @staticmethod
+    def load_arrays(import_id):
+        """ Читает колонки графа выгрузки: citizen_ids, месяцы рождения и связи (citizen_id, relative_id). """
+        table = Citizen.__table__
+        citizens = db_worker.execute(select(table.c.citizen_id, extract('month', table.c.birth_date))
+                                     .where(table.c.import_id == import_id).order_by(table.c.citizen_id)).all()
+        citizen_ids = numpy.array([row[0] for row in citizens], dtype=numpy.int32)
+        months = numpy.array([int(row[1]) for row in citizens], dtype=numpy.uint8)
+        relations = numpy.array([tuple(row) for row in db_worker.execute(Relations.select_relations(import_id))],
+                                dtype=numpy.int32).reshape(-1, 2)
+        return citizen_ids, months, relations
+
+    @staticmethod
+    def from_arrays(version, citizen_ids, months, relations):
+        """ Строит граф по отсортированным citizen_ids, их месяцам рождения и массиву связей (citizen_id, relative_id),
+            упорядоченному по citizen_id. """
+        sources = numpy.searchsorted(citizen_ids, relations[:, 0])
+        indptr = numpy.zeros(len(citizen_ids) + 1, dtype=numpy.int32)
+        numpy.cumsum(numpy.bincount(sources, minlength=len(citizen_ids)), out=indptr[1:])
+        indices = numpy.searchsorted(citizen_ids, relations[:, 1]).astype(numpy.int32)
+        return RelativesGraph(version, citizen_ids, months, indptr, indices)
+
+    def relatives_by_citizen(self):
+        """ Возвращает словарь citizen_id -> список relative_id, как Relations.get_relatives_by_citizen. """
+        relative_ids = self.citizen_ids[self.indices].tolist()
+        bounds = self.indptr.tolist()
+        return {citizen_id: relative_ids[bounds[i]:bounds[i + 1]]
+                for i, citizen_id in enumerate(self.citizen_ids.tolist()) if bounds[i] != bounds[i + 1]}
+
+    def presents_rows(self):
+        """ Возвращает строки (month, citizen_id, presents) в порядке Presents.select_presents.
+
+            Каждая связь (citizen, relative) дает relative подарок в месяц рождения citizen,
+            ключ подарка - (month - 1) * N + позиция relative. Связи упорядочены по citizen, поэтому
+            первое вхождение ключа дает первого дарящего, по которому строки упорядочены внутри месяца. """
+        size = len(self.citizen_ids)
+        sources = numpy.repeat(numpy.arange(size), numpy.diff(self.indptr))
+        keys = (self.months[sources].astype(numpy.int64) - 1) * size + self.indices
+        keys, first_edges, counts = numpy.unique(keys, return_index=True, return_counts=True)
+        order = numpy.lexsort((keys % size, sources[first_edges], keys // size))
+        keys = keys[order]
+        return list(zip((keys // size + 1).tolist(), self.citizen_ids[keys % size].tolist(),
+                        counts[order].tolist()))
+
+
+class GraphIndex:
+    """ Графы последних использованных выгрузок суммарным размером не больше max_bytes. """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.graphs = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, import_id):
+        """ Возвращает актуальный граф выгрузки или None, если выгрузки не существует. """
+        version = Import.get_version(import_id)
+        if version is None:
+            return None
+        with self.lock:
+            graph = self.graphs.get(import_id)
+            if graph is not None and graph.version == version:
+                self.graphs.move_to_end(import_id)
+                return graph
+        graph = RelativesGraph.load(import_id, version)
+        self.set(import_id, graph)
+        return graph
+
+    def set(self, import_id, graph):
+        with self.lock:
+            old_graph = self.graphs.pop(import_id, None)
+            if old_graph is not None:
+                self.size -= old_graph.nbytes
+            if graph.nbytes > self.max_bytes:
+                return
+            self.graphs[import_id] = graph
+            self.size += graph.nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self.graphs.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.graphs.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'imports': {str(import_id): {'version': graph.version, 'citizens': len(graph.citizen_ids),
+                                                 'relations': len(graph.indices), 'bytes': graph.nbytes}
+                                for import_id, graph in self.graphs.items()}}
+
+
+def count_presents(import_id):
+    """ То же, что Citizen.count_presents, но по графу в памяти. """
+    graph = graph_index.get(import_id)
+    if graph is None:
+        return None
+    return Citizen.presents_rows_to_dict(graph.presents_rows())
+
+
+def get_all_citizens(import_id):
+    """ То же, что Import.get_all_citizens, но relatives берутся из графа в памяти. """
+    graph = graph_index.get(import_id)
+    if graph is None:
+        return None
+    return Import.get_all_citizens(import_id, graph.relatives_by_citizen())
+
+
+graph_index = GraphIndex(int(os.environ.get('GRAPH_INDEX_MAX_BYTES', 256 * 2 ** 20)))
@@ -0,0 +1,67 @@
+""" Фоновая загрузка выгрузок.
+
+    POST /imports?async=1 записывает задачу в таблицу import_jobs и ставит ее в очередь пула потоков
+    IMPORT_JOB_WORKERS процесса, принявшего запрос. Задача загружает выгрузку тем же путем, что и потоковый
+    синхронный запрос, и записывает статус и прогресс в import_jobs, поэтому GET /imports/jobs/<job_id>
+    отвечает любой процесс. """
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from api.models import Import, ImportJob
+from api.streaming import iter_import_citizens
+from api.wsgi import app, db
+
+MAX_FINISHED_JOBS = 1000
+SINGLE_WRITER_DIALECTS = {'sqlite'}
+
+logger = logging.getLogger('api.jobs')
+
+
+def execute_job(job_id, body):
+    """ Загружает выгрузку задачи job_id из тела запроса body в текущем контексте приложения.
+        Некорректная выгрузка завершает задачу статусом failed, как синхронный запрос завершается ответом 400.
+        В SINGLE_WRITER_DIALECTS запись прогресса ждала бы конца транзакции загрузки,
+        поэтому там прогресс записывается только вместе с итоговым статусом. """
+    import_id, citizens_processed = None, 0
+    write_progress = db.engine.dialect.name not in SINGLE_WRITER_DIALECTS
+
+    def progress(count):
+        nonlocal citizens_processed
+        citizens_processed = count
+        if write_progress:
+            ImportJob.update_job(job_id, citizens_processed=count)
+
+    ImportJob.update_job(job_id, status='running')
+    try:
+        import_id = Import.create_import_stream(iter_import_citizens(io.BytesIO(body)), progress)
+    finally:
+        ImportJob.update_job(job_id, status='done' if import_id else 'failed', import_id=import_id,
+                             citizens_processed=citizens_processed, finished_at=datetime.utcnow())
+    return import_id
+
+
+class ImportJobs:
+    def __init__(self, flask_app, workers):
+        self.app = flask_app
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='import-job')
+
+    def submit(self, body):
+        """ Записывает задачу, ставит ее в очередь и возвращает ее статус. """
+        job_id = ImportJob.create_job(len(body))
+        ImportJob.forget_finished(MAX_FINISHED_JOBS)
+        self.executor.submit(self.run, job_id, body)
+        return ImportJob.get_job(job_id)
+
+    def run(self, job_id, body):
+        """ Выполняет задачу в потоке пула. Исключение записывается в лог, иначе оно осталось бы в Future. """
+        with self.app.app_context():
+            try:
+                execute_job(job_id, body)
+            except Exception:
+                logger.exception('Import job %s failed', job_id)
+
+
+import_jobs = ImportJobs(app, int(os.environ.get('IMPORT_JOB_WORKERS', 1)))
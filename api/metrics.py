@@ -0,0 +1,132 @@
+""" Метрики запросов в формате Prometheus.
+
+    Для каждого маршрута собираются гистограммы времени ответа, числа и суммарного времени SQL-запросов
+    (по событиям движка SQLAlchemy) и размеров тела запроса и ответа. Метрики хранятся в памяти процесса.
+    Если задан SLOW_REQUEST_MS, запросы дольше этого времени записываются в лог api.slow_requests
+    вместе со списком выполненных SQL-запросов. """
+import logging
+import os
+import time
+from threading import Lock
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 1000)
+SIZE_BUCKETS = (100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8)
+
+slow_requests_logger = logging.getLogger('api.slow_requests')
+
+
+class Histogram:
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = dict()
+        self.lock = Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            bucket_counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1
+            bucket_counts[-1] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.description), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            for labels, (bucket_counts, total, count) in sorted(self.series.items()):
+                label_text = ','.join('%s="%s"' % label for label in labels)
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), bucket_counts):
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, label_text, bound, bucket_count))
+                lines.append('%s_sum{%s} %s' % (self.name, label_text, total))
+                lines.append('%s_count{%s} %d' % (self.name, label_text, count))
+        return lines
+
+
+class Metrics:
+    def __init__(self, slow_request_seconds=None):
+        self.slow_request_seconds = slow_request_seconds
+        self.latency = Histogram('http_request_duration_seconds', 'Request latency.', LATENCY_BUCKETS)
+        self.queries = Histogram('http_request_sql_queries', 'SQL statements per request.', QUERIES_BUCKETS)
+        self.queries_time = Histogram('http_request_sql_duration_seconds', 'Total SQL time per request.',
+                                      LATENCY_BUCKETS)
+        self.request_size = Histogram('http_request_size_bytes', 'Request body size.', SIZE_BUCKETS)
+        self.response_size = Histogram('http_response_size_bytes', 'Response body size, streamed bodies excluded.',
+                                       SIZE_BUCKETS)
+        self.histograms = (self.latency, self.queries, self.queries_time, self.request_size, self.response_size)
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        event.listen(Engine, 'handle_error', self.handle_error)
+
+    def before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_queries_time = 0.0
+        g.metrics_statements = [] if self.slow_request_seconds is not None else None
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+        if not has_request_context() or 'metrics_start' not in g:
+            return
+        g.metrics_queries += 1
+        g.metrics_queries_time += elapsed
+        if g.metrics_statements is not None:
+            g.metrics_statements.append((elapsed, statement))
+
+    @staticmethod
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get('metrics_query_start'):
+            context.connection.info['metrics_query_start'].pop()
+
+    def after_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        labels = (('method', request.method), ('route', request.url_rule.rule if request.url_rule else 'unmatched'))
+        self.latency.observe(labels + (('status', str(response.status_code)),), elapsed)
+        self.queries.observe(labels, g.metrics_queries)
+        self.queries_time.observe(labels, g.metrics_queries_time)
+        self.request_size.observe(labels, request.content_length or 0)
+        if not response.is_streamed:
+            self.response_size.observe(labels, response.calculate_content_length() or 0)
+        if self.slow_request_seconds is not None and elapsed >= self.slow_request_seconds:
+            slow_requests_logger.warning('%s %s: %.1f ms, %d queries, %.1f ms in SQL\n%s', request.method,
+                                         request.full_path, elapsed * 1000, g.metrics_queries,
+                                         g.metrics_queries_time * 1000,
+                                         '\n'.join('%8.1f ms  %s' % (query_time * 1000, statement)
+                                                   for query_time, statement in g.metrics_statements))
+        return response
+
+    def render(self):
+        return '\n'.join(line for histogram in self.histograms for line in histogram.render()) + '\n'
+
+    def clear(self):
+        for histogram in self.histograms:
+            with histogram.lock:
+                histogram.series.clear()
+
+
+def get_slow_request_seconds(value):
+    return float(value) / 1000 if value else None
+
+
+metrics = Metrics(get_slow_request_seconds(os.environ.get('SLOW_REQUEST_MS')))
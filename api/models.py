@@ -1,18 +1,32 @@
-from collections import defaultdict
-from datetime import date
-from numpy import percentile
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from itertools import islice
+from operator import attrgetter
+from uuid import uuid4
+import numpy
 
-from sqlalchemy import Enum
+from sqlalchemy import Enum, and_, delete, extract, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, IntegrityError
 
 from api.wsgi import db, db_worker
+from api.validators import REQUIRED_FIELDS, parse_citizen, parse_citizens
 
-REQUIRED_FIELDS = {'citizen_id', 'town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender',
-                   'relatives'}
+CITIZEN_FIELDS = ('citizen_id', 'town', 'street', 'building', 'apartment', 'name', 'gender')
+CITIZEN_ROW_FIELDS = CITIZEN_FIELDS + ('birth_date',)
+LISTING_FIELDS = CITIZEN_ROW_FIELDS + ('relatives',)
+JOB_FIELDS = ('job_id', 'status', 'bytes_total', 'citizens_processed', 'import_id')
+INSERT_BATCH_SIZE = 1000
+FETCH_BATCH_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+get_citizen_fields = attrgetter(*CITIZEN_FIELDS)
 
 
 class Citizen(db.Model):
     __tablename__ = "citizens"
-    import_id = db.Column(db.Integer, primary_key=True)
+    import_id = db.Column(db.Integer, db.ForeignKey('imports.import_id'), primary_key=True)
     citizen_id = db.Column(db.Integer, primary_key=True)
     town = db.Column(db.String(80), nullable=False)
     street = db.Column(db.String(80), nullable=False)
@@ -23,12 +37,17 @@ class Citizen(db.Model):
     gender = db.Column(Enum("female", "male", name="gender_enum", create_type=False))
     relatives = db.relationship("Relations", backref='citizen')
 
-    def as_dict(self):
-        """ Возвращает словарь, содержащий все поля переданного citizen. """
-        atr = {c.name: getattr(self, c.name) for c in self.__table__.columns if
-               c.name != 'import_id' and c.name != 'birth_date'}
-        atr['birth_date'] = self.birth_date.strftime('%d.%m.%Y')
-        atr['relatives'] = Relations.get_all_relatives_id(self.import_id, self.citizen_id)
+    __table_args__ = (db.Index('ix_citizens_import_id_town', 'import_id', 'town', 'birth_date'),)
+
+    def as_dict(self, relatives=None):
+        """ Возвращает словарь, содержащий все поля переданного citizen.
+            birth_date остается датой и форматируется при кодировании ответа.
+            Если relatives не переданы, они запрашиваются из базы данных. """
+        atr = dict(zip(CITIZEN_FIELDS, get_citizen_fields(self)))
+        atr['birth_date'] = self.birth_date
+        if relatives is None:
+            relatives = Relations.get_all_relatives_id(self.import_id, self.citizen_id)
+        atr['relatives'] = relatives
         return atr
 
     @staticmethod
@@ -37,67 +56,142 @@ class Citizen(db.Model):
 
     @staticmethod
     def create_citizen(import_id, data):
-        if not Citizen.is_data_valid(data) or REQUIRED_FIELDS ^ data.keys() \
-                or Citizen.get_citizen(import_id, data['citizen_id']):
+        data = parse_citizen(data)
+        if not data or REQUIRED_FIELDS ^ data.keys() or Citizen.get_citizen(import_id, data['citizen_id']):
             return None
         citizen = Citizen(import_id=import_id, citizen_id=data['citizen_id'], town=data['town'],
                           street=data['street'],
                           building=data['building'], apartment=data['apartment'], name=data['name'],
-                          birth_date=date(*reversed([int(x) for x in data['birth_date'].split('.')])),
-                          gender=data['gender'])
+                          birth_date=data['birth_date'], gender=data['gender'])
         db_worker.add(citizen)
         return citizen
 
+    @staticmethod
+    def select_months(import_id, citizen_ids):
+        """ Блокирует строки citizens (SELECT ... FOR UPDATE) и возвращает словарь citizen_id -> месяц рождения.
+            Строки блокируются в порядке citizen_id, чтобы параллельные запросы не ждали друг друга по кругу. """
+        table = Citizen.__table__
+        return {citizen_id: birth_date.month for citizen_id, birth_date in db_worker.execute(
+            select(table.c.citizen_id, table.c.birth_date)
+            .where(table.c.import_id == import_id, table.c.citizen_id.in_(citizen_ids))
+            .order_by(table.c.citizen_id).with_for_update())}
+
     @staticmethod
     def change_data(import_id, citizen_id, data):
-        if not Citizen.is_data_valid(data) \
+        """ Изменяет citizen и возвращает его словарь в формате as_dict или None, если data некорректны.
+
+            citizen и его новые relatives блокируются до чтения связей, прежние relatives - до вычисления
+            изменений подарков, поэтому параллельные PATCH этих citizens выполняются по очереди и не теряют
+            изменения подарков. citizen и его relatives читаются один раз, изменения подарков от birth_date
+            и relatives применяются вместе, а ответ собирается из состояния в памяти, без чтения после commit. """
+        data = parse_citizen(data)
+        if not data \
                 or REQUIRED_FIELDS & data.keys() != data.keys() \
-                or 'citizen_id' in data.keys() \
-                or not Citizen.get_citizen(import_id, citizen_id):
+                or 'citizen_id' in data.keys():
             return None
-        citizen = Citizen.get_citizen(import_id, citizen_id)
+        new_relatives = set(data.get('relatives', ()))
+        months = Citizen.select_months(import_id, new_relatives | {citizen_id})
+        if citizen_id not in months or citizen_id in new_relatives or new_relatives - months.keys():
+            db_worker.rollback()
+            return None
+        citizen = db.session.get(Citizen, (import_id, citizen_id))
+        relatives = Relations.get_all_relatives_id(import_id, citizen_id)
+        month = data['birth_date'].month if 'birth_date' in data else citizen.birth_date.month
+        deltas = Presents.move_deltas(relatives, citizen.birth_date.month, month)
+        if 'relatives' in data:
+            unlocked = set(relatives) - months.keys()
+            if unlocked:
+                months.update(Citizen.select_months(import_id, unlocked))
+            months[citizen_id] = month
+            deltas.update(Relations.update_relations(import_id, citizen_id, relatives, new_relatives, months))
+            relatives = sorted(new_relatives)
         for key, value in data.items():
-            if key == 'relatives':
-                if not Relations.change_relations(import_id, citizen_id, value):
-                    db_worker.rollback()
-                    return None
-            elif key == 'birth_date':
-                citizen.birth_date = date(*reversed([int(x) for x in data['birth_date'].split('.')]))
-            else:
-                citizen.__setattr__(key, value)
-
+            if key != 'relatives':
+                setattr(citizen, key, value)
+        Presents.apply_deltas(import_id, deltas)
+        Import.bump_version(import_id)
+        result = citizen.as_dict(relatives)
         db_worker.commit()
-        return citizen
+        return result
 
     @staticmethod
     def count_presents(import_id):
-        """ Метод пробегает по каждому citizen и увеличивает количество подарков,
-            необходимых для каждого его родственника в этом месяце, на единицу.
+        """ Читает количество подарков из материализованной таблицы presents. """
+        rows = db_worker.execute(Presents.select_presents(import_id)).all()
+        if not rows and Import.get_version(import_id) is None:
+            return None
+        return Citizen.presents_rows_to_dict(rows)
+
+    @staticmethod
+    def presents_rows_to_dict(rows):
+        """ Группирует строки (month, citizen_id, presents) по месяцам.
 
             presents представляет собой массив из 12 словарей, соответствующих каждому месяцу года.
             Ключом такого словаря является citizen_id,
             а значением - количество подарков, необходимых купить данному citizen в этом месяце. """
-
         presents = [defaultdict(int) for _ in range(12)]
-        if not Citizen.query.filter_by(import_id=import_id).first():
-            return None
-        for citizen in Citizen.query.filter_by(import_id=import_id):
-            for relation in Relations.query.filter_by(import_id=import_id, citizen_id=citizen.citizen_id):
-                presents[citizen.birth_date.month - 1][relation.relative_id] += 1
+        for month, citizen_id, presents_count in rows:
+            presents[month - 1][citizen_id] = presents_count
         return Citizen.presents_count_to_dict(presents)
 
     @staticmethod
     def get_age_stat(import_id):
-        stat = defaultdict(list)
-        for citizen in Citizen.query.filter_by(import_id=import_id):
-            stat[citizen.town].append(Citizen.calculate_age(citizen.birth_date))
+        """ Возвращает перцентили возрастов citizens по городам.
+            Готовые ответы кэшируются в api.cache по версии выгрузки, поэтому здесь результат не сохраняется:
+            изменение, сделанное другим процессом, сразу видно по новой версии. """
+        return Citizen.calculate_age_stat(db_worker.execute(Citizen.select_towns_and_birth_dates(import_id)).all(),
+                                          date.today())
+
+    @staticmethod
+    def select_towns_and_birth_dates(import_id):
+        table = Citizen.__table__
+        return select(table.c.town, table.c.birth_date).where(table.c.import_id == import_id)
+
+    @staticmethod
+    def calculate_age_stat(rows, today):
+        """ Считает перцентили возрастов по строкам (town, birth_date).
+
+            Возрасты считаются векторно, а все три перцентиля города - одним вызовом percentile.
+            Города следуют в порядке первого появления в rows. """
+        if not rows:
+            return []
+        town_names, town_codes, birth_dates = Citizen.encode_towns_and_birth_dates(rows)
+        return Citizen.calculate_age_stat_arrays(town_names, town_codes, birth_dates, today)
+
+    @staticmethod
+    def encode_towns_and_birth_dates(rows):
+        """ Превращает строки (town, birth_date) в колонки: названия городов в порядке первого появления,
+            массив кодов городов и массив datetime64[D] дат рождения. """
+        towns, birth_dates = zip(*rows)
+        town_names, first_rows, town_index = numpy.unique(numpy.array(towns, dtype=object),
+                                                          return_index=True, return_inverse=True)
+        order = numpy.argsort(first_rows)
+        town_codes = numpy.empty_like(order)
+        town_codes[order] = numpy.arange(len(order))
+        return town_names[order].tolist(), town_codes[town_index.ravel()], numpy.array(birth_dates, 'datetime64[D]')
+
+    @staticmethod
+    def calculate_age_stat_arrays(town_names, town_codes, birth_dates, today):
+        """ Перцентили возрастов по колонкам из encode_towns_and_birth_dates. Города следуют в порядке кодов. """
+        ages = Citizen.calculate_ages(birth_dates, today)
+        town_ages = numpy.split(ages[numpy.argsort(town_codes, kind='stable')],
+                                numpy.cumsum(numpy.bincount(town_codes, minlength=len(town_names)))[:-1])
         res = []
-        for town, ages in stat.items():
-            res.append({'town': town, 'p50': round(percentile(ages, 50), 1),
-                        'p75': round(percentile(ages, 75), 1),
-                        'p99': round(percentile(ages, 99), 1)})
+        for town, ages_in_town in zip(town_names, town_ages):
+            p50, p75, p99 = numpy.percentile(ages_in_town, [50, 75, 99])
+            res.append({'town': town, 'p50': round(float(p50), 1),
+                        'p75': round(float(p75), 1),
+                        'p99': round(float(p99), 1)})
         return res
 
+    @staticmethod
+    def calculate_ages(birth_dates, today):
+        """ Векторный аналог calculate_age для массива datetime64[D]. """
+        months = birth_dates.astype('datetime64[M]')
+        years = months.astype('datetime64[Y]').astype(int) + 1970
+        birthdays = (months.astype(int) % 12 + 1) * 100 + (birth_dates - months).astype(int) + 1
+        return today.year - years - (birthdays > today.month * 100 + today.day)
+
     @staticmethod
     def calculate_age(birth_date):  # pragma: no cover
         today = date.today()
@@ -105,31 +199,7 @@ class Citizen(db.Model):
 
     @staticmethod
     def is_data_valid(data):
-        if not data or type(data) is not dict:
-            return False
-        for value in data.values():
-            if value is None:
-                return False
-        if ('citizen_id' in data.keys() and type(data['citizen_id']) is not int) \
-                or ('apartment' in data.keys() and type(data['apartment']) is not int):
-            return False
-        for field in REQUIRED_FIELDS - {'citizen_id', 'apartment', 'relatives'}:
-            if field in data.keys() and (type(data[field]) is not str or not data[field]):
-                return False
-        if 'gender' in data.keys() and data['gender'] not in {'male', 'female'}:
-            return False
-        if 'birth_date' in data.keys():
-            try:
-                date(*reversed([int(x) for x in data['birth_date'].split('.')]))
-            except (ValueError, TypeError):
-                return False
-        if 'relatives' in data.keys():
-            if type(data['relatives']) is not list:
-                return False
-            for relative_id in data['relatives']:
-                if type(relative_id) is not int:
-                    return False
-        return True
+        return parse_citizen(data) is not None
 
     @staticmethod
     def presents_count_to_dict(presents):
@@ -148,91 +218,455 @@ class Relations(db.Model):
     relative_id = db.Column(db.Integer, primary_key=True)
 
     __table_args__ = (db.ForeignKeyConstraint(['import_id', 'citizen_id'],
-                                              ['citizens.import_id', 'citizens.citizen_id']),)
+                                              ['citizens.import_id', 'citizens.citizen_id']),
+                      db.Index('ix_relations_import_id_relative_id', 'import_id', 'relative_id', 'citizen_id'))
 
     @staticmethod
-    def create_all_relations(import_id, relations):
-        """ Принимает на вход словарь , ключами которого являются citizen_id,
-            а значениями - set, содержащие citizen_id ближайших родственников данного citizen.
+    def update_relations(import_id, citizen_id, old_relatives, new_relatives, months):
+        """ Заменяет связи citizen с old_relatives на связи с new_relatives в обе стороны.
+
+            Изменения выполняются над множествами: одна пакетная вставка связей в обе стороны и одно
+            удаление с IN. new_relatives уже проверены, months - месяцы рождения citizen и всех добавленных
+            и удаленных relatives, прочитанные с блокировкой.
+            Возвращает изменения подарков для Presents.apply_deltas. """
+        new_relatives = set(new_relatives)
+        old_relatives = set(old_relatives)
+        added = new_relatives - old_relatives
+        removed = old_relatives - new_relatives
+        relations = []
+        for relative_id in added:
+            relations.append({'import_id': import_id, 'citizen_id': citizen_id, 'relative_id': relative_id})
+            relations.append({'import_id': import_id, 'citizen_id': relative_id, 'relative_id': citizen_id})
+        db_worker.insert_many(Relations.__table__, relations, INSERT_BATCH_SIZE)
+        if removed:
+            db.session.execute(Relations.delete_relations(import_id, citizen_id, removed))
+        return Presents.relatives_deltas(citizen_id, added, removed, months)
 
-            Метод возвращиет True, если родственные связи успешно созданы, и False в противном случае. """
+    @staticmethod
+    def delete_relations(import_id, citizen_id, relative_ids):
+        """ Удаляет связи citizen с relative_ids в обе стороны. Обратные связи находятся
+            по индексу (import_id, relative_id). """
+        return delete(Relations).where(or_(
+            and_(Relations.import_id == import_id, Relations.citizen_id == citizen_id,
+                 Relations.relative_id.in_(relative_ids)),
+            and_(Relations.import_id == import_id, Relations.relative_id == citizen_id,
+                 Relations.citizen_id.in_(relative_ids)))) \
+            .execution_options(synchronize_session=False)
+
+    @staticmethod
+    def get_all_relatives_id(import_id, citizen_id):
+        table = Relations.__table__
+        return db_worker.execute(select(table.c.relative_id)
+                                 .where(table.c.import_id == import_id, table.c.citizen_id == citizen_id)
+                                 .order_by(table.c.relative_id)).scalars().all()
+
+    @staticmethod
+    def get_relatives_by_citizen(import_id):
+        """ Возвращает словарь citizen_id -> список relative_id для всей выгрузки одним запросом. """
+        return Relations.group_relatives(db_worker.execute(Relations.select_relations(import_id)))
+
+    @staticmethod
+    def select_relations(import_id):
+        table = Relations.__table__
+        return select(table.c.citizen_id, table.c.relative_id).where(table.c.import_id == import_id) \
+            .order_by(table.c.citizen_id, table.c.relative_id)
+
+    @staticmethod
+    def group_relatives(rows):
+        relatives = defaultdict(list)
+        for citizen_id, relative_id in rows:
+            relatives[citizen_id].append(relative_id)
+        return relatives
+
+
+class Presents(db.Model):
+    """ Материализованное количество подарков, которые citizen_id покупает в месяце month.
+
+        Таблица заполняется при создании выгрузки и поддерживается инкрементально при изменении
+        birth_date и relatives, поэтому подсчет подарков сводится к одному чтению по индексу.
+        first_citizen_id - наименьший citizen_id среди дарящих: внутри месяца подарки выдаются
+        в порядке первого дарящего, как при обходе citizens по возрастанию citizen_id. """
+    import_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    citizen_id = db.Column(db.Integer, primary_key=True)
+    presents = db.Column(db.Integer, nullable=False)
+    first_citizen_id = db.Column(db.Integer)
+
+    __table_args__ = (db.ForeignKeyConstraint(['import_id', 'citizen_id'],
+                                              ['citizens.import_id', 'citizens.citizen_id']),
+                      db.Index('ix_presents_import_id_citizen_id', 'import_id', 'citizen_id'))
 
-        for citizen_id, relatives in relations.items():
+    @staticmethod
+    def select_presents(import_id):
+        table = Presents.__table__
+        return select(table.c.month, table.c.citizen_id, table.c.presents) \
+            .where(table.c.import_id == import_id) \
+            .order_by(table.c.month, table.c.first_citizen_id, table.c.citizen_id)
+
+    @staticmethod
+    def prepare_presents(import_id, citizens, relations):
+        """ Возвращает строки таблицы presents для подготовленных строк citizens и relations. """
+        months = {citizen['citizen_id']: citizen['birth_date'].month for citizen in citizens}
+        presents = Counter()
+        first_citizen_ids = dict()
+        for relation in relations:
+            key = (months[relation['citizen_id']], relation['relative_id'])
+            presents[key] += 1
+            first_citizen_ids[key] = min(first_citizen_ids.get(key, relation['citizen_id']), relation['citizen_id'])
+        return [{'import_id': import_id, 'month': month, 'citizen_id': citizen_id, 'presents': presents_count,
+                 'first_citizen_id': first_citizen_ids[(month, citizen_id)]}
+                for (month, citizen_id), presents_count in presents.items()]
+
+    @staticmethod
+    def move_deltas(relatives, old_month, new_month):
+        """ Изменения подарков при переносе дня рождения citizen с родственниками relatives
+            из old_month в new_month. """
+        deltas = Counter()
+        if old_month != new_month:
             for relative_id in relatives:
-                if relative_id not in relations.keys() or citizen_id not in relations[relative_id] \
-                        or not Relations.create_relation(import_id, citizen_id, relative_id):
-                    return False
-        return True
+                deltas[(old_month, relative_id)] -= 1
+                deltas[(new_month, relative_id)] += 1
+        return deltas
 
     @staticmethod
-    def create_relation(import_id, citizen_id, relative_id):
-        """ Создает одностороннее отношение и возвращает его. """
-        if not Citizen.query.get((import_id, relative_id)) or citizen_id == relative_id:
-            return None
-        relation = Relations(import_id=import_id, citizen_id=citizen_id, relative_id=relative_id)
-        db_worker.add(relation)
-        return relation
-
-    @staticmethod
-    def change_relations(import_id, citizen_id, new_relatives):
-        """ Двусторонне изменяет отношения между citizen и его relative. """
-        old_relatives = {relation.relative_id for relation in
-                         Relations.query.filter_by(import_id=import_id, citizen_id=citizen_id)}
-        for relative_id in set(new_relatives) - old_relatives:
-            if not Relations.create_relation(import_id, citizen_id, relative_id) \
-                    or not Relations.create_relation(import_id, relative_id, citizen_id):
-                return False
-        for relative_id in old_relatives - set(new_relatives):
-            Relations.delete_relation(import_id, citizen_id, relative_id)
-        return True
-
-    @staticmethod
-    def delete_relation(import_id, citizen_id, relative_id):  # pragma: no cover
-        """ Двусторонне удаляет отношения между citizen и его relative.
-            Возвращает True, если удаление прошло успешно, False - в противном случае"""
-        if not Relations.query.get((import_id, citizen_id, relative_id)) \
-                or not Relations.query.get((import_id, relative_id, citizen_id)):
-            return False
-        Relations.query.filter_by(import_id=import_id, citizen_id=citizen_id, relative_id=relative_id).delete()
-        Relations.query.filter_by(import_id=import_id, citizen_id=relative_id, relative_id=citizen_id).delete()
-        return True
+    def relatives_deltas(citizen_id, added, removed, months):
+        """ Изменения подарков для добавленных и удаленных родственных связей citizen.
+            months содержит месяцы рождения citizen и всех затронутых relatives. """
+        deltas = Counter()
+        for relative_ids, delta in ((added, 1), (removed, -1)):
+            for relative_id in relative_ids:
+                deltas[(months[citizen_id], relative_id)] += delta
+                deltas[(months[relative_id], citizen_id)] += delta
+        return deltas
 
     @staticmethod
-    def get_all_relatives_id(import_id, citizen_id):
-        return [relation.relative_id for relation in
-                Relations.query.filter_by(import_id=import_id, citizen_id=citizen_id)]
+    def apply_deltas(import_id, deltas):
+        """ Применяет изменения количества подарков вида (month, citizen_id) -> delta.
+
+            Изменения прибавляются в SQL (presents = presents + delta, новые строки - через ON CONFLICT),
+            а не записываются посчитанным в Python значением, поэтому параллельные PATCH citizens
+            с общими relatives не теряют изменения друг друга. Строки, в которых количество подарков
+            становится нулевым, удаляются, в остальных затронутых строках заново вычисляется first_citizen_id,
+            поэтому relations и birth_date к этому моменту должны быть уже изменены. """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        db_worker.execute_many(Presents.upsert_presents(),
+                               [{'import_id': import_id, 'month': month, 'citizen_id': citizen_id, 'presents': delta}
+                                for (month, citizen_id), delta in deltas.items()], INSERT_BATCH_SIZE)
+        table = Presents.__table__
+        citizen_ids = {citizen_id for _, citizen_id in deltas}
+        db_worker.execute(delete(table).where(table.c.import_id == import_id, table.c.citizen_id.in_(citizen_ids),
+                                              table.c.presents == 0))
+        db_worker.execute(update(table).where(table.c.import_id == import_id, table.c.citizen_id.in_(citizen_ids))
+                          .values(first_citizen_id=Presents.select_first_citizen_id()))
+
+    @staticmethod
+    def select_first_citizen_id():
+        """ Коррелированный подзапрос: наименьший citizen_id среди relatives citizen строки presents,
+            родившихся в ее month. Связи находятся по индексу (import_id, relative_id, citizen_id). """
+        presents, relations, citizens = Presents.__table__, Relations.__table__, Citizen.__table__
+        return select(func.min(relations.c.citizen_id)) \
+            .select_from(relations.join(citizens, and_(citizens.c.import_id == relations.c.import_id,
+                                                       citizens.c.citizen_id == relations.c.citizen_id))) \
+            .where(relations.c.import_id == presents.c.import_id, relations.c.relative_id == presents.c.citizen_id,
+                   extract('month', citizens.c.birth_date) == presents.c.month) \
+            .scalar_subquery()
 
+    @staticmethod
+    def upsert_presents():
+        """ INSERT в presents, который при совпадении ключа прибавляет presents к существующей строке. """
+        table = Presents.__table__
+        statement = UPSERT_DIALECTS[db.engine.dialect.name](table)
+        return statement.on_conflict_do_update(index_elements=[table.c.import_id, table.c.month, table.c.citizen_id],
+                                               set_={'presents': table.c.presents + statement.excluded.presents})
+
+
+class Import(db.Model):
+    """ Выгрузка и ее метаданные. import_id выдается последовательностью базы данных,
+        поэтому параллельные выгрузки не получают одинаковый идентификатор. """
+    __tablename__ = "imports"
+    import_id = db.Column(db.Integer, db.Sequence('import_id_seq'), primary_key=True)
+    citizens_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def allocate(citizens_count=0):
+        """ Создает запись о выгрузке в текущей транзакции и возвращает ее. """
+        new_import = Import(citizens_count=citizens_count)
+        db_worker.add(new_import)
+        db_worker.flush()
+        return new_import
 
-class Import:
     @staticmethod
     def get_new_import_id():
-        last_rec = Citizen.query.order_by(
-            Citizen.import_id.desc()).first()
-        return 1 if not last_rec else last_rec.import_id + 1
+        return Import.allocate().import_id
+
+    @staticmethod
+    def get_version(import_id):
+        """ Возвращает версию данных выгрузки или None, если выгрузки не существует. """
+        return db_worker.execute(Import.select_version(import_id)).scalar()
+
+    @staticmethod
+    def select_version(import_id):
+        table = Import.__table__
+        return select(table.c.version).where(table.c.import_id == import_id)
+
+    @staticmethod
+    def bump_version(import_id):
+        Import.query.filter(Import.import_id == import_id) \
+            .update({Import.version: Import.version + 1}, synchronize_session=False)
 
     @staticmethod
     def create_import(data):
-        if not data:
+        """ Проверяет всю выгрузку в памяти и записывает citizens и relations
+            пакетными многострочными INSERT в одной транзакции. """
+        if not data or type(data) is not list:
+            return None
+        import_id = Import.allocate(len(data)).import_id
+        rows = Import.prepare_import(import_id, data)
+        if not rows:
+            db_worker.rollback()
+            return None
+        citizens, relations = rows
+        db_worker.insert_many(Citizen.__table__, citizens, INSERT_BATCH_SIZE)
+        db_worker.insert_many(Relations.__table__, relations, INSERT_BATCH_SIZE)
+        db_worker.insert_many(Presents.__table__, Presents.prepare_presents(import_id, citizens, relations),
+                              INSERT_BATCH_SIZE)
+        db_worker.commit()
+        return import_id
+
+    @staticmethod
+    def prepare_import(import_id, data):
+        """ Валидирует выгрузку целиком и возвращает строки для таблиц citizens и relations.
+
+            Уникальность citizen_id и симметричность родственных связей проверяются на множествах,
+            без обращений к базе данных. Возвращает None, если выгрузка некорректна. """
+        citizens = parse_citizens(data)
+        if not citizens:
             return None
-        import_id = Import.get_new_import_id()
-        relationships = defaultdict(set)
-        for citizen_data in data:
-            citizen = Citizen.create_citizen(import_id, citizen_data)
-            if not citizen:
-                db_worker.rollback()
+        relationships = dict()
+        for citizen in citizens:
+            if citizen['citizen_id'] in relationships:
                 return None
-            relationships[citizen.citizen_id] = set(citizen_data['relatives'])
+            relationships[citizen['citizen_id']] = set(citizen.pop('relatives'))
+            citizen['import_id'] = import_id
 
-        is_relations_created = Relations.create_all_relations(import_id, relationships)
-        if not is_relations_created:
+        relations = []
+        for citizen_id, relatives in relationships.items():
+            if citizen_id in relatives:
+                return None
+            for relative_id in relatives:
+                if citizen_id not in relationships.get(relative_id, ()):
+                    return None
+                relations.append({'import_id': import_id, 'citizen_id': citizen_id, 'relative_id': relative_id})
+        return citizens, relations
+
+    @staticmethod
+    def create_import_stream(citizens, progress=None):
+        """ Загружает выгрузку из итератора citizens пакетами по STREAM_BATCH_SIZE, не собирая ее в памяти.
+
+            Каждый пакет проверяется и сразу вставляется в таблицу citizens, а от него остаются только
+            массивы numpy: citizen_id, месяцы рождения и ориентированные родственные связи.
+            После последнего пакета по ним проверяются уникальность citizen_id и симметричность связей,
+            затем вставляются relations и presents. Любая ошибка, в том числе ValueError из итератора,
+            откатывает транзакцию целиком, тогда возвращается None.
+            После каждого пакета вызывается progress(число загруженных citizens), если он передан. """
+        citizens = iter(citizens)
+        new_import = Import.allocate()
+        import_id = new_import.import_id
+        citizen_ids, months, edges = [], [], []
+        try:
+            for batch in iter(lambda: list(islice(citizens, STREAM_BATCH_SIZE)), []):
+                rows = parse_citizens(batch)
+                if not rows:
+                    raise ValueError('Invalid citizens')
+                batch_edges = []
+                for citizen in rows:
+                    relatives = set(citizen.pop('relatives'))
+                    if citizen['citizen_id'] in relatives:
+                        raise ValueError('Citizen is a relative of itself')
+                    batch_edges.extend((citizen['citizen_id'], relative_id) for relative_id in relatives)
+                    citizen['import_id'] = import_id
+                db_worker.insert_many(Citizen.__table__, rows, INSERT_BATCH_SIZE)
+                citizen_ids.append(numpy.array([citizen['citizen_id'] for citizen in rows], dtype=numpy.int64))
+                months.append(numpy.array([citizen['birth_date'].month for citizen in rows], dtype=numpy.uint8))
+                edges.append(numpy.array(batch_edges, dtype=numpy.int64).reshape(-1, 2))
+                if progress:
+                    progress(sum(len(ids) for ids in citizen_ids))
+            if not citizen_ids:
+                raise ValueError('Empty import')
+            citizen_ids, months, edges = (numpy.concatenate(arrays) for arrays in (citizen_ids, months, edges))
+            order = citizen_ids.argsort(kind='stable')
+            citizen_ids, months = citizen_ids[order], months[order]
+            if (citizen_ids[1:] == citizen_ids[:-1]).any() or not Import.is_symmetric(edges):
+                raise ValueError('Invalid relatives')
+            Import.insert_relations_and_presents(import_id, citizen_ids, months, edges)
+        except (ValueError, OverflowError, IntegrityError, DataError):
             db_worker.rollback()
             return None
+        new_import.citizens_count = len(citizen_ids)
         db_worker.commit()
         return import_id
 
     @staticmethod
-    def get_all_citizens(import_id):
-        res = []
-        for citizen in Citizen.query.filter_by(import_id=import_id):
-            res.append(citizen.as_dict())
-        return res
+    def insert_relations_and_presents(import_id, citizen_ids, months, edges):
+        """ Вставляет relations из массива ориентированных связей edges и presents, посчитанные по нему.
+            citizen_ids отсортированы, months - месяцы рождения этих citizens. """
+        db_worker.insert_many(Relations.__table__, Import.iter_edge_rows(import_id, edges), INSERT_BATCH_SIZE)
+        edge_months = months[numpy.searchsorted(citizen_ids, edges[:, 0])].astype(numpy.int64)
+        presents, groups, counts = numpy.unique(numpy.column_stack((edge_months, edges[:, 1])), axis=0,
+                                                return_inverse=True, return_counts=True)
+        first_citizen_ids = numpy.full(len(counts), numpy.iinfo(numpy.int64).max)
+        numpy.minimum.at(first_citizen_ids, groups.ravel(), edges[:, 0].astype(numpy.int64))
+        db_worker.insert_many(Presents.__table__,
+                              Import.iter_presents_rows(import_id, presents, counts, first_citizen_ids),
+                              INSERT_BATCH_SIZE)
+
+    @staticmethod
+    def is_symmetric(edges):
+        """ Проверяет, что для каждой ориентированной связи (citizen_id, relative_id) из массива edges
+            есть обратная. Связи citizen не повторяются, поэтому достаточно сравнить отсортированные массивы. """
+        backward = edges[:, ::-1]
+        return numpy.array_equal(edges[numpy.lexsort((edges[:, 1], edges[:, 0]))],
+                                 backward[numpy.lexsort((backward[:, 1], backward[:, 0]))])
+
+    @staticmethod
+    def iter_edge_rows(import_id, edges):
+        for start in range(0, len(edges), INSERT_BATCH_SIZE):
+            for citizen_id, relative_id in edges[start:start + INSERT_BATCH_SIZE].tolist():
+                yield {'import_id': import_id, 'citizen_id': citizen_id, 'relative_id': relative_id}
+
+    @staticmethod
+    def iter_presents_rows(import_id, presents, counts, first_citizen_ids):
+        for start in range(0, len(counts), INSERT_BATCH_SIZE):
+            end = start + INSERT_BATCH_SIZE
+            for (month, citizen_id), presents_count, first_citizen_id in zip(
+                    presents[start:end].tolist(), counts[start:end].tolist(), first_citizen_ids[start:end].tolist()):
+                yield {'import_id': import_id, 'month': month, 'citizen_id': citizen_id, 'presents': presents_count,
+                       'first_citizen_id': first_citizen_id}
+
+    @staticmethod
+    def select_citizens(import_id):
+        """ Запрос строк citizens с колонками CITIZEN_ROW_FIELDS. """
+        table = Citizen.__table__
+        return select(*(table.c[field] for field in CITIZEN_ROW_FIELDS)) \
+            .where(table.c.import_id == import_id).order_by(table.c.citizen_id)
+
+    @staticmethod
+    def citizen_row_to_dict(row, relatives):
+        """ Возвращает словарь citizen в формате Citizen.as_dict по строке запроса select_citizens. """
+        citizen = dict(zip(CITIZEN_ROW_FIELDS, row))
+        citizen['relatives'] = relatives
+        return citizen
+
+    @staticmethod
+    def select_citizens_page(import_id, columns, limit=None, after=None):
+        """ Запрос citizen_id и колонок columns для citizens с citizen_id больше after,
+            не больше limit + 1 строк: лишняя строка показывает, что есть следующая страница. """
+        table = Citizen.__table__
+        statement = select(table.c.citizen_id, *(table.c[column] for column in columns)) \
+            .where(table.c.import_id == import_id)
+        if after is not None:
+            statement = statement.where(table.c.citizen_id > after)
+        statement = statement.order_by(table.c.citizen_id)
+        return statement.limit(limit + 1) if limit else statement
+
+    @staticmethod
+    def get_citizens_page(import_id, fields=LISTING_FIELDS, limit=None, after=None):
+        """ Возвращает страницу citizens с полями fields (в порядке LISTING_FIELDS) и курсор следующей страницы
+            или None, если выгрузки не существует.
+
+            Страница выбирается по индексу (import_id, citizen_id) после курсора after - citizen_id последнего
+            citizen предыдущей страницы, поэтому время не зависит от номера страницы. relatives читаются
+            только при запросе этого поля, одним запросом по диапазону citizen_id страницы. """
+        columns = [field for field in CITIZEN_ROW_FIELDS if field in fields]
+        rows = db_worker.execute(Import.select_citizens_page(import_id, columns, limit, after)).all()
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+        if not rows and Import.get_version(import_id) is None:
+            return None
+        relatives = dict()
+        if 'relatives' in fields and rows:
+            table = Relations.__table__
+            relatives = Relations.group_relatives(db_worker.execute(
+                Relations.select_relations(import_id)
+                .where(table.c.citizen_id >= rows[0][0], table.c.citizen_id <= rows[-1][0])))
+        citizens = []
+        for row in rows:
+            citizen = dict(zip(columns, row[1:]))
+            if 'relatives' in fields:
+                citizen['relatives'] = relatives.get(row[0], [])
+            citizens.append(citizen)
+        return citizens, next_cursor
+
+    @staticmethod
+    def get_all_citizens(import_id, relatives=None):
+        """ Загружает citizens и их relations двумя запросами, независимо от размера выгрузки.
+            Готовый словарь citizen_id -> relatives можно передать в relatives. """
+        if relatives is None:
+            relatives = Relations.get_relatives_by_citizen(import_id)
+        return [Import.citizen_row_to_dict(row, relatives.get(row[0], []))
+                for row in db_worker.execute(Import.select_citizens(import_id))]
+
+    @staticmethod
+    def iter_citizens(import_id):
+        """ Генератор словарей citizens для потоковой выдачи.
+
+            citizens и relations читаются серверными курсорами пачками по FETCH_BATCH_SIZE строк,
+            оба упорядочены по citizen_id и сливаются за один проход, поэтому память не зависит от размера выгрузки. """
+        options = {'stream_results': True, 'max_row_buffer': FETCH_BATCH_SIZE}
+        relations = iter(db_worker.execute(Relations.select_relations(import_id).execution_options(**options)))
+        relation = next(relations, None)
+        for row in db_worker.execute(Import.select_citizens(import_id).execution_options(**options)):
+            relatives = []
+            while relation is not None and relation[0] == row[0]:
+                relatives.append(relation[1])
+                relation = next(relations, None)
+            yield Import.citizen_row_to_dict(row, relatives)
+
+
+class ImportJob(db.Model):
+    """ Фоновая загрузка выгрузки (POST /imports?async=1). Статус и прогресс записываются отдельными
+        транзакциями, поэтому их видит любой процесс, пока транзакция самой загрузки не завершена.
+        status: queued, running, done или failed. """
+    __tablename__ = "import_jobs"
+    __table_args__ = (db.Index('ix_import_jobs_finished_at', 'finished_at'),)
+    job_id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    bytes_total = db.Column(db.Integer, nullable=False)
+    citizens_processed = db.Column(db.Integer, nullable=False, default=0)
+    import_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    @staticmethod
+    def create_job(bytes_total):
+        """ Записывает задачу в очереди и возвращает ее job_id. """
+        job_id = uuid4().hex
+        db_worker.execute_committed(ImportJob.__table__.insert().values(job_id=job_id, bytes_total=bytes_total))
+        return job_id
+
+    @staticmethod
+    def update_job(job_id, **values):
+        table = ImportJob.__table__
+        db_worker.execute_committed(update(table).where(table.c.job_id == job_id).values(**values))
+
+    @staticmethod
+    def get_job(job_id):
+        """ Возвращает словарь с полями JOB_FIELDS или None, если задачи не существует. """
+        table = ImportJob.__table__
+        row = db_worker.execute(select(*(table.c[field] for field in JOB_FIELDS))
+                                .where(table.c.job_id == job_id)).first()
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+    @staticmethod
+    def forget_finished(keep):
+        """ Удаляет завершенные задачи, кроме keep последних. """
+        table = ImportJob.__table__
+        finished = table.c.finished_at.isnot(None)
+        kept = select(table.c.job_id).where(finished).order_by(table.c.finished_at.desc()).limit(keep)
+        db_worker.execute_committed(delete(table).where(finished, table.c.job_id.notin_(kept)))
@@ -0,0 +1,72 @@
+""" Кодирование ответов и разбор тел запросов в JSON.
+
+    Реализация выбирается переменной окружения JSON_BACKEND: json (стандартная библиотека),
+    orjson или auto (по умолчанию) - orjson, если он установлен. Даты кодируются в формате ДД.ММ.ГГГГ. """
+import json
+import os
+from datetime import date
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+DATE_FORMAT = '%d.%m.%Y'
+
+
+def encode_default(value):
+    if isinstance(value, date):
+        return value.strftime(DATE_FORMAT)
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
+
+
+class Serializer:
+    """ Общая часть реализаций: подклассы задают name, item_separator, dumps(data) и loads(body). """
+    name = None
+    item_separator = None
+
+    def iter_dumps_list(self, key, items):
+        """ Кодирует {key: items} по частям, не собирая items в памяти.
+            Склеенные части совпадают с dumps({key: list(items)}). """
+        head, tail = self.dumps({key: []}).split(b'[]')
+        prefix = head + b'['
+        for item in items:
+            yield prefix + self.dumps(item)
+            prefix = self.item_separator
+        if prefix != self.item_separator:
+            yield prefix
+        yield b']' + tail
+
+
+class JsonSerializer(Serializer):
+    name = 'json'
+    item_separator = b', '
+
+    def dumps(self, data):
+        return json.dumps(data, ensure_ascii=False, default=encode_default).encode()
+
+    def loads(self, body):
+        return json.loads(body)
+
+
+class OrjsonSerializer(Serializer):
+    name = 'orjson'
+    item_separator = b','
+
+    def dumps(self, data):
+        return orjson.dumps(data, default=encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def loads(self, body):
+        return orjson.loads(body)
+
+
+SERIALIZERS = {'json': JsonSerializer, 'orjson': OrjsonSerializer}
+
+
+def get_serializer(name='auto'):
+    if name == 'auto':
+        name = 'orjson' if orjson else 'json'
+    return SERIALIZERS[name]()
+
+
+serializer = get_serializer(os.environ.get('JSON_BACKEND', 'auto'))
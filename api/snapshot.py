@@ -0,0 +1,103 @@
+""" Снимок выгрузки в колоночном формате NumPy .npz.
+
+    Каждое поле citizens хранится отдельным массивом, строковые поля и gender - словарем уникальных значений
+    и массивом кодов, birth_date - массивом datetime64[D]. Родственные связи хранятся один раз на пару
+    (citizen_id < relative_id). Снимок восстанавливается в новую выгрузку пакетными INSERT, presents
+    считаются по массивам, без разбора JSON. Массивы объектов Python не допускаются (allow_pickle=False). """
+import io
+import zipfile
+
+import numpy
+from sqlalchemy.exc import DataError, IntegrityError
+
+from api.models import CITIZEN_ROW_FIELDS, INSERT_BATCH_SIZE, Citizen, Import, Relations
+from api.validators import GENDERS
+from api.wsgi import db_worker
+
+SNAPSHOT_VERSION = 1
+DICTIONARY_FIELDS = ('town', 'street', 'building', 'name', 'gender')
+INTEGER_FIELDS = ('citizen_id', 'apartment')
+
+
+def export_import(import_id):
+    """ Возвращает снимок выгрузки в виде байтов .npz или None, если выгрузки не существует. """
+    rows = db_worker.execute(Import.select_citizens(import_id)).all()
+    if not rows:
+        return None
+    columns = dict(zip(CITIZEN_ROW_FIELDS, zip(*rows)))
+    arrays = {'version': numpy.array(SNAPSHOT_VERSION)}
+    for field in INTEGER_FIELDS:
+        arrays[field] = numpy.array(columns[field], dtype=numpy.int64)
+    for field in DICTIONARY_FIELDS:
+        arrays[field + '_values'], arrays[field + '_codes'] = numpy.unique(numpy.array(columns[field], dtype=str),
+                                                                           return_inverse=True)
+        arrays[field + '_codes'] = arrays[field + '_codes'].ravel().astype(numpy.int32)
+    arrays['birth_date'] = numpy.array(columns['birth_date'], dtype='datetime64[D]')
+    edges = numpy.array([tuple(row) for row in db_worker.execute(Relations.select_relations(import_id))],
+                        dtype=numpy.int64).reshape(-1, 2)
+    arrays['relations'] = edges[edges[:, 0] < edges[:, 1]]
+    snapshot = io.BytesIO()
+    numpy.savez_compressed(snapshot, **arrays)
+    return snapshot.getvalue()
+
+
+def read_snapshot(snapshot):
+    """ Возвращает колонки citizens и массив связей из открытого .npz. Некорректный снимок приводит к ValueError. """
+    if int(snapshot['version']) != SNAPSHOT_VERSION:
+        raise ValueError('Unsupported snapshot version')
+    columns = dict()
+    for field in INTEGER_FIELDS:
+        columns[field] = snapshot[field]
+        if columns[field].dtype.kind not in 'iu':
+            raise ValueError('Invalid %s' % field)
+    for field in DICTIONARY_FIELDS:
+        values, codes = snapshot[field + '_values'], snapshot[field + '_codes']
+        if values.dtype.kind != 'U' or codes.dtype.kind not in 'iu' or (codes < 0).any() \
+                or not (numpy.char.str_len(values) > 0).all():
+            raise ValueError('Invalid %s' % field)
+        columns[field] = values[codes]
+    columns['birth_date'] = snapshot['birth_date']
+    relations = snapshot['relations']
+
+    citizen_ids = numpy.sort(columns['citizen_id'])
+    if len({len(column) for column in columns.values()}) != 1 or not len(citizen_ids) \
+            or any(column.ndim != 1 for column in columns.values()) \
+            or (citizen_ids[1:] == citizen_ids[:-1]).any() \
+            or set(columns['gender'].tolist()) - GENDERS \
+            or columns['birth_date'].dtype != numpy.dtype('datetime64[D]') or numpy.isnat(columns['birth_date']).any() \
+            or relations.dtype.kind not in 'iu' or relations.ndim != 2 or relations.shape[1] != 2 \
+            or (relations[:, 0] >= relations[:, 1]).any() \
+            or not numpy.isin(relations, citizen_ids).all():
+        raise ValueError('Invalid snapshot')
+    return columns, relations
+
+
+def iter_citizen_rows(import_id, columns):
+    for start in range(0, len(columns['citizen_id']), INSERT_BATCH_SIZE):
+        batch = {field: columns[field][start:start + INSERT_BATCH_SIZE].tolist() for field in CITIZEN_ROW_FIELDS}
+        for values in zip(*(batch[field] for field in CITIZEN_ROW_FIELDS)):
+            row = dict(zip(CITIZEN_ROW_FIELDS, values))
+            row['import_id'] = import_id
+            yield row
+
+
+def restore_import(file):
+    """ Создает новую выгрузку из снимка file (путь или файловый объект).
+        Возвращает import_id или None, если снимок некорректен. """
+    try:
+        with numpy.load(file, allow_pickle=False) as snapshot:
+            columns, relations = read_snapshot(snapshot)
+    except (OSError, ValueError, KeyError, IndexError, TypeError, zipfile.BadZipFile):
+        return None
+    import_id = Import.allocate(len(columns['citizen_id'])).import_id
+    try:
+        db_worker.insert_many(Citizen.__table__, iter_citizen_rows(import_id, columns), INSERT_BATCH_SIZE)
+        order = numpy.argsort(columns['citizen_id'])
+        months = columns['birth_date'].astype('datetime64[M]').astype(numpy.int64) % 12 + 1
+        Import.insert_relations_and_presents(import_id, columns['citizen_id'][order], months[order],
+                                             numpy.concatenate((relations, relations[:, ::-1])))
+    except (IntegrityError, DataError):
+        db_worker.rollback()
+        return None
+    db_worker.commit()
+    return import_id
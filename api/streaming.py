@@ -0,0 +1,108 @@
+""" Потоковый разбор тела POST /imports.
+
+    Тело читается из потока частями по READ_CHUNK_SIZE байт, элементы массива citizens разбираются
+    по одному, поэтому в памяти находится только еще не разобранный хвост, а не вся выгрузка. """
+import codecs
+import json
+
+READ_CHUNK_SIZE = 64 * 1024
+MAX_VALUE_SIZE = 1024 * 1024
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARS = '0123456789+-.eE'
+
+decoder = json.JSONDecoder()
+
+
+class JsonStreamReader:
+    """ Читает JSON из потока байтов по частям. Отдельное значение не может быть длиннее MAX_VALUE_SIZE символов. """
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def read_more(self):
+        """ Дочитывает очередную часть потока, отбрасывая уже разобранное начало буфера.
+            Возвращает False, если поток закончился раньше. """
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.position:] + self.decoder.decode(chunk, final=self.eof)
+        self.position = 0
+        if len(self.buffer) > MAX_VALUE_SIZE:
+            raise ValueError('JSON value is too large')
+        return True
+
+    def peek(self):
+        """ Возвращает следующий значащий символ, не сдвигая позицию, или '' в конце потока. """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or not self.read_more():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, chars):
+        """ Пропускает следующий значащий символ и возвращает его. Это должен быть один из chars. """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expected one of %r' % chars)
+        self.position += 1
+        return char
+
+    def read_value(self):
+        """ Разбирает следующее значение целиком. Значение, которое заканчивается ровно на конце буфера,
+            разбирается повторно после чтения следующей части: число могло быть разрезано. Так же разбирается
+            число, за которым в буфере идет символ числа: из разрезанных 1.5e3 в буфере "1.5e" разбирается только 1. """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.read_more():
+                    raise
+                continue
+            cut = end == len(self.buffer) or type(value) in (int, float) and self.buffer[end] in NUMBER_CHARS
+            if not cut or not self.read_more():
+                self.position = end
+                return value
+
+    def iter_array(self):
+        """ Генератор элементов массива, который начинается со следующего значащего символа. """
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self.read_value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_import_citizens(stream, key='citizens', chunk_size=READ_CHUNK_SIZE):
+    """ Генератор citizens из тела вида {"citizens": [...]}. Остальные ключи объекта разбираются и отбрасываются.
+
+        Некорректный JSON, отсутствие ключа или значение key, не являющееся массивом, приводят к ValueError,
+        в том числе после того, как часть citizens уже выдана. """
+    reader = JsonStreamReader(stream, chunk_size)
+    reader.expect('{')
+    found = False
+    while True:
+        name = reader.read_value()
+        if type(name) is not str:
+            raise ValueError('Expected object key')
+        reader.expect(':')
+        if name == key:
+            if found or reader.peek() != '[':
+                raise ValueError('Expected a single %s array' % key)
+            found = True
+            yield from reader.iter_array()
+        else:
+            reader.read_value()
+        if reader.expect(',}') == '}':
+            break
+    if reader.peek() or not found:
+        raise ValueError('Expected a single object with %s array' % key)
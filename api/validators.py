@@ -0,0 +1,85 @@
+""" Проверка и разбор данных citizens.
+
+    Для каждого поля заранее выбрана функция разбора, поэтому словарь citizen обходится один раз,
+    а birth_date разбирается в date единожды и дальше используется готовым. """
+from datetime import date
+from functools import lru_cache
+
+REQUIRED_FIELDS = {'citizen_id', 'town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender',
+                   'relatives'}
+GENDERS = {'male', 'female'}
+
+
+def parse_int(value):
+    if type(value) is not int:
+        raise ValueError(value)
+    return value
+
+
+def parse_string(value):
+    if type(value) is not str or not value:
+        raise ValueError(value)
+    return value
+
+
+def parse_gender(value):
+    if parse_string(value) not in GENDERS:
+        raise ValueError(value)
+    return value
+
+
+@lru_cache(maxsize=65536)
+def parse_date_string(value):
+    return date(*reversed([int(x) for x in value.split('.')]))
+
+
+def parse_birth_date(value):
+    return parse_date_string(parse_string(value))
+
+
+def parse_relatives(value):
+    if type(value) is not list:
+        raise ValueError(value)
+    for relative_id in value:
+        parse_int(relative_id)
+    return value
+
+
+FIELD_PARSERS = {'citizen_id': parse_int,
+                 'town': parse_string,
+                 'street': parse_string,
+                 'building': parse_string,
+                 'apartment': parse_int,
+                 'name': parse_string,
+                 'birth_date': parse_birth_date,
+                 'gender': parse_gender,
+                 'relatives': parse_relatives}
+
+
+def parse_citizen(data):
+    """ Возвращает копию data с birth_date, разобранной в date, или None, если data некорректны.
+        Поля, не входящие в REQUIRED_FIELDS, не проверяются, но не могут быть None. """
+    if not data or type(data) is not dict:
+        return None
+    citizen = dict()
+    try:
+        for key, value in data.items():
+            if value is None:
+                return None
+            parser = FIELD_PARSERS.get(key)
+            citizen[key] = parser(value) if parser else value
+    except (ValueError, TypeError):
+        return None
+    return citizen
+
+
+def parse_citizens(citizens):
+    """ Разбирает весь массив citizens выгрузки. Каждый citizen должен содержать ровно REQUIRED_FIELDS.
+        Возвращает список разобранных citizens или None, если хотя бы один из них некорректен. """
+    parsed = []
+    for data in citizens:
+        citizen = parse_citizen(data)
+        if not citizen or citizen.keys() != REQUIRED_FIELDS:
+            return None
+        parsed.append(citizen)
+    return parsed
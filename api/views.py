@@ -1,62 +1,211 @@
-import json
+import io
+from datetime import date
+from itertools import chain
 
-from flask import request
+from flask import Response, request, stream_with_context, url_for
 
-from api.models import Import, Citizen
+from api import graph
+from api.analytics import MAX_IMPORTS, analytics
+from api.bulk import MAX_ITEMS, change_citizens
+from api.cache import response_cache
+from api.jobs import import_jobs
+from api.metrics import metrics
+from api.models import LISTING_FIELDS, Import, ImportJob, Citizen
+from api.serializer import serializer
+from api.snapshot import export_import, restore_import
+from api.streaming import iter_import_citizens
 from .wsgi import app
 
+MAX_PAGE_SIZE = 10000
+
+
+def get_request_data():
+    """ Разбирает тело запроса. Возвращает None, если тело пустое или не является JSON. """
+    try:
+        return serializer.loads(request.get_data())
+    except ValueError:
+        return None
+
+
+def cached_response(name, import_id, get_data, tag=''):
+    """ Возвращает ответ {"data": get_data(import_id)} из кэша, если версия выгрузки не изменилась.
+
+        Ответ помечается ETag из import_id и версии выгрузки (и tag, если данные зависят еще от чего-то),
+        на запрос с совпадающим If-None-Match возвращается 304 без тела. """
+    version = Import.get_version(import_id)
+    etag = '%d-%d%s' % (import_id, version, tag) if version is not None else None
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    key = '%s:%s:%s' % (serializer.name, name, etag)
+    body = response_cache.get(key) if etag else None
+    if body is None:
+        data = get_data(import_id)
+        if not data:
+            return serializer.dumps({}), 400
+        body = serializer.dumps({'data': data})
+        if etag:
+            response_cache.set(key, body)
+    response = Response(body, 200)
+    if etag:
+        response.set_etag(etag)
+    return response
+
 
 @app.route('/imports', methods=['POST'])
 def handle_import_request():
     if request.method == 'POST':
-        data = request.json
-        if not data or 'citizens' not in data.keys():
-            return json.dumps({}), 400
-        import_id = Import.create_import(data['citizens'])
+        if request.args.get('async') == '1':
+            job = import_jobs.submit(request.get_data())
+            response = Response(serializer.dumps({'data': job}), 202)
+            response.headers['Location'] = url_for('handle_import_job_request', job_id=job['job_id'])
+            return response
+        if app.config['STREAM_IMPORTS']:
+            import_id = Import.create_import_stream(iter_import_citizens(request.stream))
+        else:
+            data = get_request_data()
+            if not data or type(data) is not dict or 'citizens' not in data.keys():
+                return serializer.dumps({}), 400
+            import_id = Import.create_import(data['citizens'])
         if not import_id:
-            return json.dumps({}), 400
-        return json.dumps({"data": {"import_id": import_id}}), 201
-    return json.dumps({}), 405  # pragma:no cover
+            return serializer.dumps({}), 400
+        return serializer.dumps({"data": {"import_id": import_id}}), 201
+    return serializer.dumps({}), 405  # pragma:no cover
+
+
+@app.route('/imports/snapshot', methods=['POST'])
+def handle_snapshot_import_request():
+    import_id = restore_import(io.BytesIO(request.get_data()))
+    if not import_id:
+        return serializer.dumps({}), 400
+    return serializer.dumps({"data": {"import_id": import_id}}), 201
+
+
+@app.route('/imports/<import_id>/snapshot', methods=['GET'])
+def handle_snapshot_export_request(import_id):
+    snapshot = export_import(int(import_id))
+    if not snapshot:
+        return serializer.dumps({}), 400
+    response = Response(snapshot, 200, mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = 'attachment; filename=import-%s.npz' % import_id
+    return response
+
+
+@app.route('/imports/stats', methods=['POST'])
+def handle_imports_stats_request():
+    """ Подарки и перцентили возрастов для списка выгрузок: {"import_ids": [1, 2, ...]}. """
+    data = get_request_data()
+    import_ids = data.get('import_ids') if type(data) is dict else None
+    if not import_ids or type(import_ids) is not list or len(import_ids) > MAX_IMPORTS \
+            or any(type(import_id) is not int for import_id in import_ids):
+        return serializer.dumps({}), 400
+    stats = analytics.get_stats(import_ids)
+    if stats is None:
+        return serializer.dumps({}), 400
+    return serializer.dumps({'data': stats}), 200
+
+
+@app.route('/imports/jobs/<job_id>', methods=['GET'])
+def handle_import_job_request(job_id):
+    job = ImportJob.get_job(job_id)
+    if not job:
+        return serializer.dumps({}), 400
+    return serializer.dumps({'data': job}), 200
 
 
 @app.route('/imports/<import_id>/citizens/<citizen_id>', methods=['PATCH'])
 def handle_change_citizen_request(import_id, citizen_id):
     if request.method == 'PATCH':
-        data = request.json
+        data = get_request_data()
         if not data:
-            return json.dumps({}), 400
+            return serializer.dumps({}), 400
         citizen = Citizen.change_data(int(import_id), int(citizen_id), data)
         if not citizen:
-            return json.dumps({}), 400
-        return json.dumps(citizen.as_dict(), ensure_ascii=False), 200
-    return json.dumps({}), 405  # pragma:no cover
+            return serializer.dumps({}), 400
+        return serializer.dumps(citizen), 200
+    return serializer.dumps({}), 405  # pragma:no cover
+
+
+@app.route('/imports/<import_id>/citizens', methods=['PATCH'])
+def handle_change_citizens_request(import_id):
+    """ Изменение многих citizens в одной транзакции: {"citizens": [{"citizen_id": 1, "changes": {...}}, ...]}.
+        При ошибке хотя бы в одном элементе ничего не меняется, а ответ содержит ошибки элементов. """
+    data = get_request_data()
+    items = data.get('citizens') if type(data) is dict else None
+    if not items or type(items) is not list or len(items) > MAX_ITEMS:
+        return serializer.dumps({}), 400
+    citizens, errors = change_citizens(int(import_id), items)
+    if errors:
+        return serializer.dumps({'errors': errors}), 400
+    return serializer.dumps({'data': citizens}), 200
 
 
 @app.route('/imports/<import_id>/citizens', methods=['GET'])
 def handle_citizens_request(import_id):
     if request.method == 'GET':
-        citizens = Import.get_all_citizens(int(import_id))
-        if not citizens:
-            return json.dumps({}), 400
-        return json.dumps({"data": citizens}, ensure_ascii=False), 200
-    return json.dumps({}), 405  # pragma:no cover
+        if request.args.keys() & {'limit', 'cursor', 'fields'}:
+            return citizens_page(int(import_id))
+        if app.config['STREAM_CITIZENS']:
+            return stream_citizens(int(import_id))
+        get_all_citizens = graph.get_all_citizens if app.config['GRAPH_INDEX'] else Import.get_all_citizens
+        return cached_response('citizens', int(import_id), get_all_citizens)
+    return serializer.dumps({}), 405  # pragma:no cover
+
+
+def citizens_page(import_id):
+    """ Страница citizens: limit - размер страницы (не больше MAX_PAGE_SIZE), cursor - next_cursor
+        предыдущей страницы, fields - список полей через запятую. """
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        cursor = int(request.args['cursor']) if 'cursor' in request.args else None
+    except ValueError:
+        return serializer.dumps({}), 400
+    fields = set(request.args.get('fields', ','.join(LISTING_FIELDS)).split(','))
+    if (limit is not None and not 0 < limit <= MAX_PAGE_SIZE) or not fields or fields - set(LISTING_FIELDS):
+        return serializer.dumps({}), 400
+    page = Import.get_citizens_page(import_id, fields, limit, cursor)
+    if page is None:
+        return serializer.dumps({}), 400
+    citizens, next_cursor = page
+    return serializer.dumps({'data': citizens, 'next_cursor': next_cursor}), 200
+
+
+def stream_citizens(import_id):
+    """ Отдает citizens по мере чтения из базы данных. Байты ответа совпадают с кодированием всего списка. """
+    citizens = Import.iter_citizens(import_id)
+    first_citizen = next(citizens, None)
+    if not first_citizen:
+        return serializer.dumps({}), 400
+    return Response(stream_with_context(serializer.iter_dumps_list('data', chain([first_citizen], citizens))), 200)
 
 
 @app.route('/imports/<import_id>/citizens/birthdays', methods=['GET'])
 def handle_birthdays_request(import_id):
     if request.method == 'GET':
-        presents = Citizen.count_presents(int(import_id))
-        if not presents:
-            return json.dumps({}), 400
-        return json.dumps({'data': presents}, ensure_ascii=False), 200
-    return json.dumps({}), 405  # pragma:no cover
+        count_presents = graph.count_presents if app.config['GRAPH_INDEX'] else Citizen.count_presents
+        return cached_response('birthdays', int(import_id), count_presents)
+    return serializer.dumps({}), 405  # pragma:no cover
 
 
 @app.route('/imports/<import_id>/towns/stat/percentile/age', methods=['GET'])
 def handle_age_stat_request(import_id):
     if request.method == 'GET':
-        age_stat = Citizen.get_age_stat(int(import_id))
-        if not age_stat:
-            return json.dumps({}), 400
-        return json.dumps({'data': age_stat}, ensure_ascii=False), 200
-    return json.dumps({}), 405  # pragma:no cover
+        return cached_response('age_stat', int(import_id), Citizen.get_age_stat, '-' + date.today().isoformat())
+    return serializer.dumps({}), 405  # pragma:no cover
+
+
+@app.route('/cache/stats', methods=['GET'])
+def handle_cache_stats_request():
+    return serializer.dumps({'data': response_cache.stats()}), 200
+
+
+@app.route('/graph/stats', methods=['GET'])
+def handle_graph_stats_request():
+    return serializer.dumps({'data': graph.graph_index.stats()}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def handle_metrics_request():
+    return Response(metrics.render(), 200, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,48 @@
+""" Пропускная способность POST /imports/stats в зависимости от числа процессов пула.
+
+    python3 -m benchmarks.bench_analytics --imports 8 --citizens 50000 --workers 1 2 4 8 """
+import argparse
+import time
+
+from api.wsgi import app, db
+from api.analytics import Analytics
+from api.models import Import
+from benchmarks.bench_import import drop_import
+from benchmarks.generator import generate_import
+
+
+def measure(workers, import_ids, repeats):
+    analytics = Analytics(workers)
+    try:
+        analytics.get_stats(import_ids[:1])
+        start = time.perf_counter()
+        for _ in range(repeats):
+            analytics.get_stats(import_ids)
+        return time.perf_counter() - start
+    finally:
+        analytics.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--imports', type=int, default=8)
+    parser.add_argument('--citizens', type=int, default=50000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        import_ids = [Import.create_import(generate_import(args.citizens, seed=seed)) for seed in range(args.imports)]
+        try:
+            for workers in args.workers:
+                elapsed = measure(workers, import_ids, args.repeats)
+                print('%d workers: %7.2f s, %6.2f imports/s'
+                      % (workers, elapsed, args.imports * args.repeats / elapsed))
+        finally:
+            for import_id in import_ids:
+                drop_import(import_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+""" Сравнивает один процесс uvicorn (api.asgi) с одним синхронным воркером gunicorn (api.wsgi)
+    при большом числе одновременных запросов к аналитическим обработчикам.
+
+    DATABASE_URL=postgresql://... python3 -m benchmarks.bench_async_reads --clients 64 """
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+from benchmarks.load_test import run_client, seed, wait_for_server
+
+SERVERS = {
+    'gunicorn sync, 1 worker': lambda port: ['-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', '1',
+                                             '--bind', '127.0.0.1:%d' % port, 'api.wsgi:app'],
+    'uvicorn async, 1 process': lambda port: ['-m', 'uvicorn', 'api.asgi:app', '--log-level', 'warning',
+                                              '--host', '127.0.0.1', '--port', str(port)],
+}
+
+
+def measure(command, import_id, args):
+    bind = '127.0.0.1:%d' % args.port
+    server = subprocess.Popen([sys.executable] + command(args.port), env=dict(os.environ, CREATE_SCHEMA='0'))
+    try:
+        base = 'http://%s/imports/%d' % (bind, import_id)
+        urls = [base + '/citizens/birthdays', base + '/towns/stat/percentile/age']
+        wait_for_server(urls[0])
+        deadline = time.time() + args.duration
+        with ThreadPool(args.clients) as pool:
+            requests = sum(pool.map(run_client, [(urls, deadline)] * args.clients))
+        return requests / args.duration
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--citizens', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8089)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'reads.db'))
+    import_id = seed(args.citizens)
+    for name, command in SERVERS.items():
+        print('%-26s %3d clients: %8.1f requests/s' % (name, args.clients, measure(command, import_id, args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+""" Сравнивает изменение многих citizens отдельными PATCH (Citizen.change_data, коммит на каждого)
+    и одним пакетным изменением (api.bulk.change_citizens).
+
+    python3 -m benchmarks.bench_bulk_patch 1000 5000 """
+import random
+import sys
+import time
+
+from api.wsgi import app, db
+from api.bulk import change_citizens
+from api.models import Citizen, Import
+from benchmarks.bench_import import drop_import
+from benchmarks.generator import STREETS, generate_import
+
+CITIZENS_COUNT = 10000
+
+
+def generate_items(count, relatives_share=0.1, seed=0):
+    """ Новые адреса для count citizens, у доли relatives_share из них меняются и relatives. """
+    rnd = random.Random(seed)
+    items = []
+    for citizen_id in rnd.sample(range(1, CITIZENS_COUNT + 1), count):
+        changes = {'street': rnd.choice(STREETS), 'building': '%d' % rnd.randint(1, 200),
+                   'apartment': rnd.randint(1, 500)}
+        if rnd.random() < relatives_share:
+            changes['relatives'] = [relative_id for relative_id in rnd.sample(range(1, CITIZENS_COUNT + 1), 3)
+                                    if relative_id != citizen_id]
+        items.append({'citizen_id': citizen_id, 'changes': changes})
+    return items
+
+
+def patch_each(import_id, items):
+    for item in items:
+        if not Citizen.change_data(import_id, item['citizen_id'], dict(item['changes'])):
+            raise RuntimeError('PATCH failed')
+
+
+def patch_bulk(import_id, items):
+    if change_citizens(import_id, items)[1]:
+        raise RuntimeError('bulk PATCH failed')
+
+
+def main(sizes):
+    with app.app_context():
+        db.create_all()
+        import_id = Import.create_import(generate_import(CITIZENS_COUNT))
+        for size in sizes:
+            items = generate_items(size)
+            for name, patch in (('each', patch_each), ('bulk', patch_bulk)):
+                start = time.perf_counter()
+                patch(import_id, items)
+                elapsed = time.perf_counter() - start
+                print('%-4s %6d citizens: %8.2f s, %8.0f citizens/s' % (name, size, elapsed, size / elapsed))
+        drop_import(import_id)
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [1000, 5000])
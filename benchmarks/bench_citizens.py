@@ -0,0 +1,41 @@
+""" Замеряет задержку GET /imports/<id>/citizens: запрос relatives на каждого citizen против двух запросов.
+
+    python3 -m benchmarks.bench_citizens 10000 """
+import sys
+import time
+
+from api.wsgi import app, db
+from api.models import Citizen, Import
+from benchmarks.bench_import import drop_import
+from benchmarks.generator import generate_import
+
+REPEATS = 5
+
+
+def per_citizen_listing(import_id):
+    """ Прежний путь: as_dict запрашивает relatives отдельно для каждого citizen. """
+    return [citizen.as_dict() for citizen in Citizen.query.filter_by(import_id=import_id)]
+
+
+def measure(listing, import_id):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        listing(import_id)
+        timings.append(time.perf_counter() - start)
+        db.session.expunge_all()
+    return min(timings)
+
+
+def main(sizes):
+    with app.app_context():
+        db.create_all()
+        for size in sizes:
+            import_id = Import.create_import(generate_import(size))
+            for name, listing in (('per-citizen', per_citizen_listing), ('two-queries', Import.get_all_citizens)):
+                print('%-12s %7d citizens: %8.1f ms' % (name, size, measure(listing, import_id) * 1000))
+            drop_import(import_id)
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000])
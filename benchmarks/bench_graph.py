@@ -0,0 +1,43 @@
+""" Сравнивает подсчет подарков по таблице presents и по графу в памяти, а также загрузку графа.
+
+    python3 -m benchmarks.bench_graph 10000 100000 """
+import sys
+import time
+
+from api.wsgi import app, db
+from api import graph
+from api.models import Citizen, Import
+from benchmarks.bench_import import drop_import
+from benchmarks.generator import generate_import
+
+REPEATS = 5
+
+
+def measure(function, import_id):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(import_id)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def load_graph(import_id):
+    graph.graph_index.clear()
+    return graph.graph_index.get(import_id)
+
+
+def main(sizes):
+    with app.app_context():
+        db.create_all()
+        for size in sizes:
+            import_id = Import.create_import(generate_import(size))
+            for name, function in (('presents', Citizen.count_presents), ('graph-load', load_graph),
+                                   ('graph', graph.count_presents)):
+                print('%-10s %7d citizens: %8.1f ms' % (name, size, measure(function, import_id) * 1000))
+            print('graph memory: %.1f KB' % (graph.graph_index.get(import_id).nbytes / 1024))
+            drop_import(import_id)
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,72 @@
+""" Сравнивает скорость POST /imports: построчное создание через ORM и пакетную вставку.
+
+    python3 -m benchmarks.bench_import 10000 100000 """
+import sys
+import time
+
+from api.wsgi import app, db, db_worker
+from api.models import Citizen, Import, Presents, Relations
+from benchmarks.generator import generate_import
+
+
+def create_relation(import_id, citizen_id, relative_id):
+    """ Создает одностороннее отношение, проверяя relative отдельным запросом. """
+    if not Citizen.query.get((import_id, relative_id)) or citizen_id == relative_id:
+        return None
+    relation = Relations(import_id=import_id, citizen_id=citizen_id, relative_id=relative_id)
+    db_worker.add(relation)
+    return relation
+
+
+def create_all_relations(import_id, relationships):
+    """ Создает relations из словаря citizen_id -> set relative_id по одной строке.
+        Возвращает False, если связи несимметричны или relative не существует. """
+    for citizen_id, relatives in relationships.items():
+        for relative_id in relatives:
+            if relative_id not in relationships.keys() or citizen_id not in relationships[relative_id] \
+                    or not create_relation(import_id, citizen_id, relative_id):
+                return False
+    return True
+
+
+def per_row_import(data):
+    """ Прежний путь: Citizen.create_citizen и create_relation для каждой строки. Таблица presents
+        не заполняется, поэтому этот путь годится только для сравнения скорости. """
+    import_id = Import.get_new_import_id()
+    relationships = dict()
+    for citizen_data in data:
+        Citizen.create_citizen(import_id, citizen_data)
+        relationships[citizen_data['citizen_id']] = set(citizen_data['relatives'])
+    create_all_relations(import_id, relationships)
+    db_worker.commit()
+    return import_id
+
+
+def drop_import(import_id):
+    Presents.query.filter_by(import_id=import_id).delete()
+    Relations.query.filter_by(import_id=import_id).delete()
+    Citizen.query.filter_by(import_id=import_id).delete()
+    db_worker.commit()
+
+
+def measure(create, data):
+    rows = len(data) + sum(len(citizen['relatives']) for citizen in data)
+    start = time.perf_counter()
+    import_id = create(data)
+    elapsed = time.perf_counter() - start
+    drop_import(import_id)
+    return rows / elapsed, elapsed
+
+
+def main(sizes):
+    with app.app_context():
+        db.create_all()
+        for size in sizes:
+            data = generate_import(size)
+            for name, create in (('per-row', per_row_import), ('bulk', Import.create_import)):
+                rows_per_sec, elapsed = measure(create, data)
+                print('%-8s %7d citizens: %8.2f s, %10.0f rows/s' % (name, size, elapsed, rows_per_sec))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,43 @@
+""" Микробенчмарк кодирования ответа со списком citizens и разбора тела POST /imports
+    для каждой доступной реализации JSON.
+
+    python3 -m benchmarks.bench_json 10000 """
+import sys
+import timeit
+from datetime import date
+
+from api.serializer import SERIALIZERS, get_serializer
+from benchmarks.generator import generate_import
+
+REPEATS = 5
+
+
+def listing_payload(citizens):
+    """ Ответ GET /imports/<id>/citizens: как в Citizen.as_dict, birth_date - объект date. """
+    listing = []
+    for citizen in citizens:
+        citizen = dict(citizen)
+        citizen['birth_date'] = date(*reversed([int(x) for x in citizen['birth_date'].split('.')]))
+        listing.append(citizen)
+    return {'data': listing}
+
+
+def main(sizes):
+    for size in sizes:
+        citizens = generate_import(size)
+        listing = listing_payload(citizens)
+        for name in sorted(SERIALIZERS):
+            try:
+                serializer = get_serializer(name)
+                body = serializer.dumps({'citizens': citizens})
+            except AttributeError:
+                print('%-7s is not installed' % name)
+                continue
+            encode = min(timeit.repeat(lambda: serializer.dumps(listing), number=1, repeat=REPEATS))
+            decode = min(timeit.repeat(lambda: serializer.loads(body), number=1, repeat=REPEATS))
+            print('%-7s %7d citizens: encode listing %7.1f ms, decode import %7.1f ms (%.1f MB)'
+                  % (name, size, encode * 1000, decode * 1000, len(body) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
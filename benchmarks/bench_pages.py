@@ -0,0 +1,42 @@
+""" Задержка страницы citizens в зависимости от ее глубины и размера выгрузки, в сравнении с полным списком.
+
+    python3 -m benchmarks.bench_pages 10000 100000 """
+import sys
+import time
+
+from api.wsgi import app, db
+from api.models import Import
+from benchmarks.bench_import import drop_import
+from benchmarks.generator import generate_import
+
+REPEATS = 5
+PAGE_SIZE = 100
+
+
+def measure(read):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        read()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(sizes):
+    with app.app_context():
+        db.create_all()
+        for size in sizes:
+            import_id = Import.create_import(generate_import(size))
+            for depth in (0, 0.5, 0.99):
+                after = int(size * depth)
+                elapsed = measure(lambda: Import.get_citizens_page(import_id, limit=PAGE_SIZE, after=after))
+                print('page after %7d of %7d citizens: %8.2f ms' % (after, size, elapsed * 1000))
+                elapsed = measure(lambda: Import.get_citizens_page(import_id, {'citizen_id', 'name'}, PAGE_SIZE, after))
+                print('  fields=citizen_id,name:            %8.2f ms' % (elapsed * 1000))
+            print('full listing of %7d citizens:        %8.2f ms' % (size, measure(
+                lambda: Import.get_all_citizens(import_id)) * 1000))
+            drop_import(import_id)
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
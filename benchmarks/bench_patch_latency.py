@@ -0,0 +1,79 @@
+""" Задержка PATCH /imports/<import_id>/citizens/<citizen_id> при одновременных запросах:
+    медиана и p99 для clients клиентов к gunicorn с workers воркерами. Клиенты меняют citizens
+    из первых hot, поэтому часть запросов конкурирует за одни и те же строки.
+
+    DATABASE_URL=postgresql://... python3 -m benchmarks.bench_patch_latency --workers 4 --clients 16
+
+    Без DATABASE_URL используется файл SQLite во временном каталоге. """
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from multiprocessing.pool import ThreadPool
+
+from benchmarks.generator import STREETS
+from benchmarks.load_test import seed, wait_for_server
+
+
+def run_client(args):
+    base, hot, deadline, seed_value = args
+    rnd = random.Random(seed_value)
+    timings, errors = [], 0
+    while time.time() < deadline:
+        citizen_id = rnd.randint(1, hot)
+        changes = {'street': rnd.choice(STREETS),
+                   'birth_date': '%02d.%02d.1990' % (rnd.randint(1, 28), rnd.randint(1, 12)),
+                   'relatives': rnd.sample([i for i in range(1, hot + 1) if i != citizen_id], 2)}
+        request = urllib.request.Request('%s/citizens/%d' % (base, citizen_id), json.dumps(changes).encode(),
+                                         {'Content-Type': 'application/json'}, method='PATCH')
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+        except urllib.error.HTTPError:
+            errors += 1
+            continue
+        timings.append(time.perf_counter() - start)
+    return timings, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--citizens', type=int, default=10000)
+    parser.add_argument('--hot', type=int, default=100, help='число изменяемых citizens')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8089)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'patch.db'))
+    import_id = seed(args.citizens)
+    bind = '127.0.0.1:%d' % args.port
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                               '--workers', str(args.workers), '--bind', bind, 'api.wsgi:app'])
+    try:
+        base = 'http://%s/imports/%d' % (bind, import_id)
+        wait_for_server(base + '/citizens/birthdays')
+        deadline = time.time() + args.duration
+        with ThreadPool(args.clients) as pool:
+            results = pool.map(run_client, [(base, args.hot, deadline, client) for client in range(args.clients)])
+    finally:
+        server.terminate()
+        server.wait()
+    timings = sorted(timing for client_timings, _ in results for timing in client_timings)
+    print('%d clients, %d workers: %d PATCH, %d errors, %.1f requests/s, median %.1f ms, p99 %.1f ms'
+          % (args.clients, args.workers, len(timings), sum(errors for _, errors in results),
+             len(timings) / args.duration, statistics.median(timings) * 1000,
+             timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000))
+
+
+if __name__ == '__main__':
+    main()
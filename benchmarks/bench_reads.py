@@ -0,0 +1,70 @@
+""" Сравнивает чтение выгрузки объектами ORM и строками SQLAlchemy Core: время и пиковую память на 10 000 строк.
+
+    python3 -m benchmarks.bench_reads 10000 100000 """
+import sys
+import time
+import tracemalloc
+
+from api.wsgi import app, db
+from api.models import Citizen, Import, Presents, Relations
+from benchmarks.bench_import import drop_import
+from benchmarks.generator import generate_import
+
+REPEATS = 3
+
+
+def orm_citizens(import_id):
+    """ Прежний путь Import.get_all_citizens: объекты Citizen и их as_dict. """
+    relatives = Relations.get_relatives_by_citizen(import_id)
+    return [citizen.as_dict(relatives.get(citizen.citizen_id, []))
+            for citizen in Citizen.query.filter_by(import_id=import_id).order_by(Citizen.citizen_id)]
+
+
+def orm_relations(import_id):
+    return [(relation.citizen_id, relation.relative_id) for relation in Relations.query.filter_by(import_id=import_id)]
+
+
+def core_relations(import_id):
+    return [tuple(row) for row in db.session.execute(Relations.select_relations(import_id))]
+
+
+def orm_presents(import_id):
+    return [(row.month, row.citizen_id, row.presents) for row in Presents.query.filter_by(import_id=import_id)]
+
+
+def core_presents(import_id):
+    return db.session.execute(Presents.select_presents(import_id)).all()
+
+
+def measure(read, import_id):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        rows = len(read(import_id))
+        timings.append(time.perf_counter() - start)
+        db.session.expunge_all()
+    tracemalloc.start()
+    read(import_id)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.expunge_all()
+    return rows, min(timings), peak
+
+
+def main(sizes):
+    with app.app_context():
+        db.create_all()
+        for size in sizes:
+            import_id = Import.create_import(generate_import(size))
+            for name, orm_read, core_read in (('citizens', orm_citizens, Import.get_all_citizens),
+                                              ('relations', orm_relations, core_relations),
+                                              ('presents', orm_presents, core_presents)):
+                for kind, read in (('orm', orm_read), ('core', core_read)):
+                    rows, elapsed, peak = measure(read, import_id)
+                    print('%-9s %-4s %7d citizens: %8.1f ms, %7.2f MB peak per 10k rows'
+                          % (name, kind, size, elapsed * 1000 * 10000 / rows, peak / 2 ** 20 * 10000 / rows))
+            drop_import(import_id)
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,52 @@
+""" Сравнивает снимок .npz и JSON при переносе выгрузки: размер, время выгрузки и восстановления.
+
+    python3 -m benchmarks.bench_snapshot 10000 100000 """
+import io
+import sys
+import time
+
+from api.wsgi import app, db
+from api.models import Import
+from api.serializer import serializer
+from api.snapshot import export_import, restore_import
+from benchmarks.bench_import import drop_import
+from benchmarks.generator import generate_import
+
+
+def export_json(import_id):
+    citizens = Import.get_all_citizens(import_id)
+    for citizen in citizens:
+        citizen['birth_date'] = citizen['birth_date'].strftime('%d.%m.%Y')
+    return serializer.dumps({'citizens': citizens})
+
+
+def restore_json(body):
+    return Import.create_import(serializer.loads(body)['citizens'])
+
+
+def restore_npz(body):
+    return restore_import(io.BytesIO(body))
+
+
+def timed(function, argument):
+    start = time.perf_counter()
+    result = function(argument)
+    return result, time.perf_counter() - start
+
+
+def main(sizes):
+    with app.app_context():
+        db.create_all()
+        for size in sizes:
+            import_id = Import.create_import(generate_import(size))
+            for name, export, restore in (('json', export_json, restore_json), ('npz', export_import, restore_npz)):
+                body, export_time = timed(export, import_id)
+                restored_id, restore_time = timed(restore, body)
+                print('%-4s %7d citizens: %8.2f MB, export %6.2f s, restore %6.2f s'
+                      % (name, size, len(body) / 2 ** 20, export_time, restore_time))
+                drop_import(restored_id)
+            drop_import(import_id)
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
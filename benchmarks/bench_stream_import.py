@@ -0,0 +1,48 @@
+""" Сравнивает пиковую память и время POST /imports: разбор всего тела и потоковая загрузка.
+
+    python3 -m benchmarks.bench_stream_import 10000 100000 """
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+from api.wsgi import app, db
+from api.models import Import
+from api.streaming import iter_import_citizens
+from benchmarks.bench_import import drop_import
+from benchmarks.generator import generate_import
+
+
+def whole_body_import(body):
+    return Import.create_import(json.loads(body)['citizens'])
+
+
+def stream_import(body):
+    return Import.create_import_stream(iter_import_citizens(io.BytesIO(body)))
+
+
+def measure(create, body):
+    tracemalloc.start()
+    start = time.perf_counter()
+    import_id = create(body)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    drop_import(import_id)
+    return elapsed, peak
+
+
+def main(sizes):
+    with app.app_context():
+        db.create_all()
+        for size in sizes:
+            body = json.dumps({'citizens': generate_import(size)}, ensure_ascii=False).encode()
+            for name, create in (('whole', whole_body_import), ('stream', stream_import)):
+                elapsed, peak = measure(create, body)
+                print('%-6s %7d citizens (%6.1f MB body): %7.2f s, peak %7.1f MB'
+                      % (name, size, len(body) / 2 ** 20, elapsed, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,60 @@
+""" Генератор синтетических выгрузок для бенчмарков.
+
+    Одинаковые параметры и seed всегда дают одинаковую выгрузку. """
+import random
+from datetime import date, timedelta
+
+TOWNS = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Тамбов']
+STREETS = ['Ленина', 'Льва Толстого', 'Иосифа Бродского', 'Гагарина', 'Мира']
+NAMES = ['Иванов Иван Иванович', 'Романова Мария Леонидовна', 'Петров Сергей Павлович']
+DEGREES = ('uniform', 'power')
+
+
+def get_towns(towns_count):
+    return (TOWNS + ['Город %d' % number for number in range(len(TOWNS) + 1, towns_count + 1)])[:towns_count]
+
+
+def get_new_relatives_count(rnd, relatives_per_citizen, degree):
+    """ Число связей, которые добавляет очередной citizen. Каждая связь увеличивает степень двух citizens,
+        поэтому средняя степень примерно равна relatives_per_citizen при обоих распределениях.
+
+        uniform - от 0 до relatives_per_citizen, power - распределение Парето с тяжелым хвостом:
+        большинство citizens почти без родственников и немногие с очень большим их числом. """
+    if degree == 'uniform':
+        return rnd.randint(0, 2 * relatives_per_citizen) // 2
+    if degree == 'power':
+        return round((rnd.paretovariate(2) - 1) * relatives_per_citizen / 2)
+    raise ValueError('Unknown degree distribution: %s' % degree)
+
+
+def generate_import(citizens_count, relatives_per_citizen=2, seed=0, degree='uniform', towns_count=len(TOWNS),
+                    town_skew=0.0):
+    """ Возвращает список citizens для POST /imports с симметричными родственными связями.
+
+        degree - распределение числа родственников (DEGREES), towns_count - число городов,
+        town_skew - показатель распределения Ципфа для городов: 0 - города равновероятны,
+        1 и больше - большинство citizens живет в нескольких первых городах. """
+    rnd = random.Random(seed)
+    relatives = [set() for _ in range(citizens_count)]
+    for citizen in range(citizens_count):
+        for _ in range(get_new_relatives_count(rnd, relatives_per_citizen, degree)):
+            relative = rnd.randrange(citizens_count)
+            if relative != citizen:
+                relatives[citizen].add(relative + 1)
+                relatives[relative].add(citizen + 1)
+
+    towns = get_towns(towns_count)
+    town_weights = [1 / rank ** town_skew for rank in range(1, len(towns) + 1)] if town_skew else None
+    first_birthday = date(1940, 1, 1)
+    citizens = []
+    for citizen in range(citizens_count):
+        citizens.append({'citizen_id': citizen + 1,
+                         'town': rnd.choices(towns, town_weights)[0] if town_weights else rnd.choice(towns),
+                         'street': rnd.choice(STREETS),
+                         'building': '%d' % rnd.randint(1, 200),
+                         'apartment': rnd.randint(1, 500),
+                         'name': rnd.choice(NAMES),
+                         'birth_date': (first_birthday + timedelta(days=rnd.randrange(25000))).strftime('%d.%m.%Y'),
+                         'gender': rnd.choice(('male', 'female')),
+                         'relatives': sorted(relatives[citizen])})
+    return citizens
@@ -0,0 +1,82 @@
+""" Нагрузочный тест: запросов в секунду на GET-обработчиках при разном числе воркеров gunicorn.
+
+    DATABASE_URL=sqlite:////tmp/load.db python3 -m benchmarks.load_test --workers 1 2 4 8
+
+    Без DATABASE_URL используется файл SQLite во временном каталоге. """
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from multiprocessing import Pool
+
+from benchmarks.generator import generate_import
+
+
+def seed(citizens_count):
+    """ Создает схему и одну выгрузку, возвращает ее import_id. """
+    from api.wsgi import app, db
+    from api.models import Import
+
+    with app.app_context():
+        db.create_all()
+        return Import.create_import(generate_import(citizens_count))
+
+
+def run_client(args):
+    urls, deadline = args
+    requests = 0
+    while time.time() < deadline:
+        with urllib.request.urlopen(urls[requests % len(urls)]) as response:
+            response.read()
+        requests += 1
+    return requests
+
+
+def wait_for_server(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start: %s' % url)
+
+
+def measure(workers, import_id, args):
+    bind = '127.0.0.1:%d' % args.port
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                               '--workers', str(workers), '--bind', bind, 'api.wsgi:app'])
+    try:
+        base = 'http://%s/imports/%d' % (bind, import_id)
+        urls = [base + '/citizens/birthdays', base + '/towns/stat/percentile/age', base + '/citizens']
+        wait_for_server(urls[0])
+        deadline = time.time() + args.duration
+        with Pool(args.clients) as pool:
+            requests = sum(pool.map(run_client, [(urls, deadline)] * args.clients))
+        return requests / args.duration
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--citizens', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8089)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load.db'))
+    import_id = seed(args.citizens)
+    for workers in args.workers:
+        print('%2d workers: %8.1f requests/s' % (workers, measure(workers, import_id, args)))
+
+
+if __name__ == '__main__':
+    main()
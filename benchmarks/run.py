@@ -0,0 +1,154 @@
+""" Сценарные бенчмарки всех обработчиков API на нескольких размерах выгрузки.
+
+    Запросы выполняются тестовым клиентом Flask в одном процессе, база данных берется из DATABASE_URL
+    (без него - файл SQLite во временном каталоге). Результаты сохраняются в JSON, два файла результатов
+    можно сравнить:
+
+    python3 -m benchmarks.run --scales 1000 10000 --output results.json
+    python3 -m benchmarks.run --compare base.json results.json """
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.generator import DEGREES, generate_import
+
+SCENARIOS = ('import', 'patch', 'citizens', 'birthdays', 'age_stat')
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(scenario, citizens_count, timings):
+    timings = sorted(timings)
+    return {'scenario': scenario,
+            'citizens': citizens_count,
+            'repeats': len(timings),
+            'min_ms': timings[0] * 1000,
+            'median_ms': statistics.median(timings) * 1000,
+            'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+            'mean_ms': statistics.mean(timings) * 1000}
+
+
+def timed(client, method, url, expected_status, **kwargs):
+    start = time.perf_counter()
+    response = client.open(url, method=method, **kwargs)
+    response.get_data()
+    elapsed = time.perf_counter() - start
+    if response.status_code != expected_status:
+        raise RuntimeError('%s %s returned %d' % (method, url, response.status_code))
+    return elapsed, response
+
+
+def run_scale(client, citizens_count, args):
+    """ Возвращает результаты всех сценариев для выгрузки из citizens_count citizens. """
+    from api.cache import response_cache
+    from benchmarks.bench_import import drop_import
+
+    data = generate_import(citizens_count, args.relatives, args.seed, args.degree, args.towns, args.town_skew)
+    body = json.dumps({'citizens': data}, ensure_ascii=False).encode()
+    timings = {scenario: [] for scenario in SCENARIOS}
+    import_ids = []
+    for _ in range(args.import_repeats):
+        elapsed, response = timed(client, 'POST', '/imports', 201, data=body, content_type='application/json')
+        timings['import'].append(elapsed)
+        import_ids.append(json.loads(response.data)['data']['import_id'])
+    import_id = import_ids[0]
+
+    rnd = random.Random(args.seed)
+    for _ in range(args.repeats):
+        citizen_id = rnd.randint(1, citizens_count)
+        changes = {'name': 'Петров Петр Петрович',
+                   'relatives': rnd.sample([i for i in range(1, min(citizens_count, 50) + 1) if i != citizen_id],
+                                           min(citizens_count - 1, 3))}
+        timings['patch'].append(timed(client, 'PATCH', '/imports/%d/citizens/%d' % (import_id, citizen_id), 200,
+                                      json=changes)[0])
+
+    for scenario, path in (('citizens', 'citizens'), ('birthdays', 'citizens/birthdays'),
+                           ('age_stat', 'towns/stat/percentile/age')):
+        for _ in range(args.repeats):
+            response_cache.clear()
+            timings[scenario].append(timed(client, 'GET', '/imports/%d/%s' % (import_id, path), 200)[0])
+
+    for import_id in import_ids:
+        drop_import(import_id)
+    return [summarize(scenario, citizens_count, timings[scenario]) for scenario in SCENARIOS]
+
+
+def run(args):
+    from api.wsgi import app, db
+
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        results = []
+        for citizens_count in args.scales:
+            for result in run_scale(client, citizens_count, args):
+                results.append(result)
+                print('%-10s %8d citizens: median %9.1f ms, p95 %9.1f ms'
+                      % (result['scenario'], result['citizens'], result['median_ms'], result['p95_ms']),
+                      file=sys.stderr)
+        return {'meta': {'commit': get_commit(),
+                         'database': db.engine.dialect.name,
+                         'python': platform.python_version(),
+                         'created_at': datetime.utcnow().isoformat(),
+                         'parameters': {key: value for key, value in vars(args).items()
+                                        if key not in ('output', 'compare')}},
+                'results': results}
+
+
+def compare(base_path, head_path):
+    """ Печатает медианы двух файлов результатов и их отношение. """
+    with open(base_path) as base_file, open(head_path) as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+    base_results = {(result['scenario'], result['citizens']): result for result in base['results']}
+    print('%-10s %8s %12s %12s %8s' % ('scenario', 'citizens', base['meta']['commit'], head['meta']['commit'], 'ratio'))
+    for result in head['results']:
+        base_result = base_results.get((result['scenario'], result['citizens']))
+        if base_result:
+            print('%-10s %8d %9.1f ms %9.1f ms %7.2fx'
+                  % (result['scenario'], result['citizens'], base_result['median_ms'], result['median_ms'],
+                     result['median_ms'] / base_result['median_ms']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeats', type=int, default=20, help='запросов каждого сценария чтения и PATCH')
+    parser.add_argument('--import-repeats', type=int, default=3)
+    parser.add_argument('--relatives', type=int, default=2, help='средняя степень родства')
+    parser.add_argument('--degree', choices=DEGREES, default='uniform')
+    parser.add_argument('--towns', type=int, default=6)
+    parser.add_argument('--town-skew', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='сравнить два файла результатов')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+    else:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
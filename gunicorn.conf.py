@@ -0,0 +1,11 @@
+""" Настройки gunicorn для запуска в production: gunicorn -c gunicorn.conf.py api.wsgi:app """
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+accesslog = os.environ.get('ACCESS_LOG')
+
+# Схема создается один раз командой flask init-db, а не каждым воркером при запуске.
+raw_env = ['CREATE_SCHEMA=0']
@@ -0,0 +1,20 @@
+-- Материализованное количество подарков для уже существующих выгрузок.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS presents (
+    import_id INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    citizen_id INTEGER NOT NULL,
+    presents INTEGER NOT NULL,
+    PRIMARY KEY (import_id, month, citizen_id),
+    FOREIGN KEY (import_id, citizen_id) REFERENCES citizens (import_id, citizen_id)
+);
+
+INSERT INTO presents (import_id, month, citizen_id, presents)
+SELECT citizens.import_id, EXTRACT(MONTH FROM citizens.birth_date)::INTEGER, relations.relative_id, COUNT(*)
+FROM citizens
+JOIN relations ON relations.import_id = citizens.import_id AND relations.citizen_id = citizens.citizen_id
+GROUP BY citizens.import_id, EXTRACT(MONTH FROM citizens.birth_date), relations.relative_id
+ON CONFLICT DO NOTHING;
+
+COMMIT;
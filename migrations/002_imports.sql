@@ -0,0 +1,23 @@
+-- Таблица выгрузок с последовательностью для import_id вместо поиска максимального import_id в citizens.
+BEGIN;
+
+CREATE SEQUENCE IF NOT EXISTS import_id_seq;
+
+CREATE TABLE IF NOT EXISTS imports (
+    import_id INTEGER NOT NULL DEFAULT nextval('import_id_seq'),
+    citizens_count INTEGER NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (import_id)
+);
+
+INSERT INTO imports (import_id, citizens_count, created_at)
+SELECT import_id, COUNT(*), now() AT TIME ZONE 'utc'
+FROM citizens
+GROUP BY import_id
+ON CONFLICT DO NOTHING;
+
+SELECT setval('import_id_seq', COALESCE((SELECT MAX(import_id) FROM imports), 0) + 1, false);
+
+ALTER TABLE citizens ADD FOREIGN KEY (import_id) REFERENCES imports (import_id);
+
+COMMIT;
@@ -0,0 +1,2 @@
+-- Версия данных выгрузки для кэша ответов и ETag.
+ALTER TABLE imports ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
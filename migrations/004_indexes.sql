@@ -0,0 +1,5 @@
+-- Индексы для обратного поиска связей, статистики возрастов по городам и обновления подарков.
+-- Выполняется без транзакции: CREATE INDEX CONCURRENTLY не блокирует запись в таблицы.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_citizens_import_id_town ON citizens (import_id, town, birth_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_relations_import_id_relative_id ON relations (import_id, relative_id, citizen_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_presents_import_id_citizen_id ON presents (import_id, citizen_id);
@@ -0,0 +1,39 @@
+-- Необязательно (PostgreSQL 12+): секционирование citizens, relations и presents по хэшу import_id.
+-- Запросы одной выгрузки читают одну из 16 секций, индексы каждой секции в 16 раз меньше,
+-- а удаление выгрузки затрагивает только ее секцию. Применяется после 004_indexes.sql.
+BEGIN;
+
+CREATE TABLE citizens_partitioned (LIKE citizens INCLUDING ALL) PARTITION BY HASH (import_id);
+CREATE TABLE relations_partitioned (LIKE relations INCLUDING ALL) PARTITION BY HASH (import_id);
+CREATE TABLE presents_partitioned (LIKE presents INCLUDING ALL) PARTITION BY HASH (import_id);
+
+DO $$
+DECLARE
+    parent TEXT;
+    remainder INTEGER;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['citizens', 'relations', 'presents'] LOOP
+        FOR remainder IN 0..15 LOOP
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+                           parent || '_' || remainder, parent || '_partitioned', remainder);
+        END LOOP;
+    END LOOP;
+END $$;
+
+INSERT INTO citizens_partitioned SELECT * FROM citizens;
+INSERT INTO relations_partitioned SELECT * FROM relations;
+INSERT INTO presents_partitioned SELECT * FROM presents;
+
+DROP TABLE presents;
+DROP TABLE relations;
+DROP TABLE citizens;
+
+ALTER TABLE citizens_partitioned RENAME TO citizens;
+ALTER TABLE relations_partitioned RENAME TO relations;
+ALTER TABLE presents_partitioned RENAME TO presents;
+
+ALTER TABLE citizens ADD FOREIGN KEY (import_id) REFERENCES imports (import_id);
+ALTER TABLE relations ADD FOREIGN KEY (import_id, citizen_id) REFERENCES citizens (import_id, citizen_id);
+ALTER TABLE presents ADD FOREIGN KEY (import_id, citizen_id) REFERENCES citizens (import_id, citizen_id);
+
+COMMIT;
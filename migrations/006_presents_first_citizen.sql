@@ -0,0 +1,16 @@
+-- Первый дарящий каждой строки presents: внутри месяца подарки выдаются в порядке первого дарящего,
+-- как при обходе citizens по возрастанию citizen_id.
+BEGIN;
+
+ALTER TABLE presents ADD COLUMN IF NOT EXISTS first_citizen_id INTEGER;
+
+UPDATE presents SET first_citizen_id = (
+    SELECT MIN(relations.citizen_id)
+    FROM relations
+    JOIN citizens ON citizens.import_id = relations.import_id AND citizens.citizen_id = relations.citizen_id
+    WHERE relations.import_id = presents.import_id
+      AND relations.relative_id = presents.citizen_id
+      AND EXTRACT(MONTH FROM citizens.birth_date) = presents.month
+);
+
+COMMIT;
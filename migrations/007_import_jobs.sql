@@ -0,0 +1,18 @@
+-- Задачи фоновой загрузки (POST /imports?async=1). Статус и прогресс хранятся в базе данных,
+-- поэтому GET /imports/jobs/<job_id> отвечает любой процесс, а не только принявший загрузку.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS import_jobs (
+    job_id VARCHAR(32) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    bytes_total INTEGER NOT NULL,
+    citizens_processed INTEGER NOT NULL,
+    import_id INTEGER,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    finished_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (job_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_import_jobs_finished_at ON import_jobs (finished_at);
+
+COMMIT;
@@ -1,9 +1,12 @@
 from datetime import date
 
 import pytest
+from sqlalchemy import event, extract, func
 
 from api import wsgi
-from api.models import Citizen, Import
+from api.cache import response_cache
+from api.graph import graph_index
+from api.models import Citizen, Import, Presents, Relations
 
 
 @pytest.fixture
@@ -113,10 +116,92 @@ def correct_age_stat_response():
              "p99": 32.0}]
 
 
+@pytest.fixture
+def large_import_data(correct_citizen_data):
+    """ 60 citizens, каждый связан с соседями по кругу. """
+    citizens_count = 60
+    data = []
+    for citizen_id in range(1, citizens_count + 1):
+        citizen = dict(correct_citizen_data)
+        citizen['citizen_id'] = citizen_id
+        citizen['birth_date'] = '%02d.%02d.1990' % (citizen_id % 28 + 1, citizen_id % 12 + 1)
+        citizen['relatives'] = [citizen_id % citizens_count + 1, (citizen_id - 2) % citizens_count + 1]
+        data.append(citizen)
+    return data
+
+
+@pytest.fixture
+def towns_import_data(large_import_data):
+    """ large_import_data, где citizens неравномерно распределены по четырем городам и родились в разные годы. """
+    data = []
+    for citizen in large_import_data:
+        citizen = dict(citizen)
+        citizen['town'] = 'Город %d' % (citizen['citizen_id'] ** 2 % 7)
+        citizen['birth_date'] = citizen['birth_date'][:6] + str(1940 + citizen['citizen_id'] * 7 % 60)
+        data.append(citizen)
+    return data
+
+
+@pytest.fixture
+def queries():
+    """ Список SQL-запросов, выполненных во время теста. """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(wsgi.db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(wsgi.db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture
+def recomputed_presents():
+    """ Эталон для таблицы presents: функция, заново считающая подарки выгрузки одним запросом.
+        citizens соединяются с их relations и группируются по месяцу рождения citizen и relative_id.
+        Возвращает словарь (month, citizen_id) -> presents или None, если выгрузки не существует. """
+    def recompute(import_id):
+        month = extract('month', Citizen.birth_date)
+        rows = wsgi.db.session.query(month, Relations.relative_id, func.count(Relations.relative_id)) \
+            .select_from(Citizen).outerjoin(Citizen.relatives) \
+            .filter(Citizen.import_id == import_id) \
+            .group_by(month, Relations.relative_id).all()
+        if not rows:
+            return None
+        return {(int(birth_month), relative_id): presents_count
+                for birth_month, relative_id, presents_count in rows if relative_id is not None}
+    return recompute
+
+
+@pytest.fixture
+def materialized_presents():
+    """ Функция, читающая таблицу presents выгрузки: словарь (month, citizen_id) -> presents. """
+    def select(import_id):
+        return {(month, citizen_id): presents for month, citizen_id, presents in
+                wsgi.db.session.execute(Presents.select_presents(import_id))}
+    return select
+
+
+@pytest.fixture
+def today(mocker):
+    """ Фиксирует текущую дату, от которой считаются возрасты в correct_age_stat_response. """
+    class FrozenDate(date):
+        current = date(2019, 8, 1)
+
+        @classmethod
+        def today(cls):
+            return cls.current
+
+    mocker.patch('api.models.date', FrozenDate)
+    return FrozenDate
+
+
 @pytest.fixture(autouse=True)
 def rollback_database():
     yield
     wsgi.db_worker.rollback()
+    response_cache.clear()
+    graph_index.clear()
 
 
 @pytest.fixture
@@ -0,0 +1,50 @@
+from flask import url_for
+
+from api.wsgi import app
+from api.analytics import Analytics, get_start_method
+from api.models import Citizen, Import
+from api.serializer import serializer
+
+
+def test_get_stats(mocker, today, large_import_data, towns_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    mocker.patch('api.analytics.date', today)
+    import_ids = [Import.create_import(large_import_data), Import.create_import(towns_import_data)]
+    expected = [{'import_id': import_id, 'birthdays': Citizen.count_presents(import_id),
+                 'age_stat': Citizen.get_age_stat(import_id)} for import_id in import_ids]
+    for workers in (0, 2):
+        analytics = Analytics(workers)
+        try:
+            assert analytics.get_stats(import_ids) == expected
+            assert analytics.get_stats(import_ids[::-1]) == expected[::-1]
+            assert analytics.get_stats(import_ids + [import_ids[-1] + 1]) is None
+        finally:
+            analytics.shutdown()
+
+
+def test_get_start_method(mocker):
+    mocker.patch('api.analytics.multiprocessing.get_all_start_methods', return_value=['fork', 'spawn', 'forkserver'])
+    mocker.patch('api.analytics.threading.active_count', return_value=1)
+    assert get_start_method() == 'fork'
+    mocker.patch('api.analytics.threading.active_count', return_value=2)
+    assert get_start_method() == 'forkserver'
+    mocker.patch('api.analytics.multiprocessing.get_all_start_methods', return_value=['spawn'])
+    assert get_start_method() == 'spawn'
+
+
+def test_handle_imports_stats_request(mocker, test_client, today, correct_import_data, correct_presents_response,
+                                      correct_age_stat_response):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    mocker.patch('api.views.analytics', Analytics(0))
+    mocker.patch('api.analytics.date', today)
+    import_id = Import.create_import(correct_import_data)
+    with app.test_request_context():
+        response = test_client.post(url_for('handle_imports_stats_request'), json={'import_ids': [import_id]})
+        assert response.status_code == 200
+        assert serializer.loads(response.data)['data'] == [{'import_id': import_id,
+                                                            'birthdays': correct_presents_response,
+                                                            'age_stat': correct_age_stat_response}]
+        for body in ({'import_ids': []}, {'import_ids': ['1']}, {'import_ids': [import_id + 1]}, [import_id],
+                     {'import_ids': list(range(1000))}):
+            response = test_client.post(url_for('handle_imports_stats_request'), json=body)
+            assert response.status_code == 400
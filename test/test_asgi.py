@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from starlette.testclient import TestClient
+
+from api import asgi
+from api.wsgi import db
+from api.models import Citizen, Import, Presents, Relations
+from api.serializer import serializer
+
+
+@pytest.fixture
+def async_client():
+    return TestClient(asgi.app)
+
+
+@pytest.fixture
+def async_engine(mocker, tmp_path):
+    """ Асинхронный движок на файле SQLite: запросы api.asgi выполняются на настоящей базе данных.
+        NullPool не переносит соединения между циклами событий теста и TestClient. """
+    engine = create_async_engine('sqlite+aiosqlite:///%s' % (tmp_path / 'asgi.db'), poolclass=NullPool)
+    mocker.patch.object(asgi, 'engine', engine)
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+async def create_import(engine, import_id, data):
+    citizens, relations = Import.prepare_import(import_id, data)
+    async with engine.begin() as connection:
+        await connection.run_sync(db.Model.metadata.create_all)
+        await connection.execute(Import.__table__.insert(), {'import_id': import_id, 'citizens_count': len(data)})
+        await connection.execute(Citizen.__table__.insert(), citizens)
+        await connection.execute(Relations.__table__.insert(), relations)
+        await connection.execute(Presents.__table__.insert(), Presents.prepare_presents(import_id, citizens, relations))
+
+
+def test_requests_read_database(mocker, async_engine, today, correct_import_data, correct_presents_response,
+                                correct_age_stat_response):
+    mocker.patch('api.asgi.date', today)
+    asyncio.run(create_import(async_engine, 1, correct_import_data))
+    async_client = TestClient(asgi.app)
+    assert async_client.get('/imports/1/citizens').json() == {'data': correct_import_data}
+    assert async_client.get('/imports/1/citizens/birthdays').json() == {'data': correct_presents_response}
+    assert async_client.get('/imports/1/towns/stat/percentile/age').json() == {'data': correct_age_stat_response}
+    for path in ('citizens', 'citizens/birthdays', 'towns/stat/percentile/age'):
+        assert async_client.get('/imports/2/%s' % path).status_code == 400
+
+
+def test_get_async_url():
+    assert asgi.get_async_url('postgresql+psycopg2://admin:1@localhost:5432/db') == \
+        'postgresql+asyncpg://admin:1@localhost:5432/db'
+    assert asgi.get_async_url('sqlite:////tmp/db.sqlite') == 'sqlite+aiosqlite:////tmp/db.sqlite'
+
+
+def test_citizens_request_ok(mocker, async_client, correct_import_data):
+    mocker.patch('api.asgi.get_all_citizens', return_value=correct_import_data)
+    response = async_client.get('/imports/1/citizens')
+    assert response.status_code == 200
+    assert response.content == serializer.dumps({'data': correct_import_data})
+
+
+def test_birthdays_request(mocker, async_client, correct_presents_response):
+    count_presents = mocker.patch('api.asgi.count_presents', return_value=correct_presents_response)
+    response = async_client.get('/imports/7/citizens/birthdays')
+    assert response.status_code == 200
+    assert response.json() == {'data': correct_presents_response}
+    assert count_presents.call_args[0][1] == 7
+
+    count_presents.return_value = None
+    assert async_client.get('/imports/7/citizens/birthdays').status_code == 400
+
+
+def test_age_stat_request(mocker, async_client, correct_age_stat_response):
+    mocker.patch('api.asgi.get_age_stat', return_value=correct_age_stat_response)
+    response = async_client.get('/imports/1/towns/stat/percentile/age')
+    assert response.status_code == 200
+    assert response.json() == {'data': correct_age_stat_response}
+
+    mocker.patch('api.asgi.get_age_stat', return_value=[])
+    assert async_client.get('/imports/1/towns/stat/percentile/age').status_code == 400
+    assert async_client.get('/imports/abc/towns/stat/percentile/age').status_code == 404
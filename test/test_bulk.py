@@ -0,0 +1,93 @@
+import random
+
+from flask import url_for
+
+from api.wsgi import app
+from api.bulk import change_citizens
+from api.models import Citizen, Import
+from api.serializer import serializer
+
+
+def random_items(rnd, citizen_ids, count):
+    items = []
+    for citizen_id in rnd.sample(citizen_ids, count):
+        changes = dict()
+        if rnd.random() < 0.6:
+            changes['relatives'] = rnd.sample([i for i in citizen_ids if i != citizen_id], rnd.randint(0, 5))
+        if rnd.random() < 0.6:
+            changes['birth_date'] = '%02d.%02d.1980' % (rnd.randint(1, 28), rnd.randint(1, 12))
+        if rnd.random() < 0.5 or not changes:
+            changes['town'] = rnd.choice(['Москва', 'Керчь'])
+            changes['apartment'] = rnd.randint(1, 100)
+        items.append({'citizen_id': citizen_id, 'changes': changes})
+    return items
+
+
+def test_change_citizens_matches_sequential_patches(mocker, large_import_data,
+                                                    recomputed_presents, materialized_presents):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    sequential_id = Import.create_import(large_import_data)
+    bulk_id = Import.create_import(large_import_data)
+    rnd = random.Random(3)
+    citizen_ids = [citizen['citizen_id'] for citizen in large_import_data]
+    for _ in range(5):
+        items = random_items(rnd, citizen_ids, 30)
+        for item in items:
+            assert Citizen.change_data(sequential_id, item['citizen_id'], dict(item['changes']))
+        citizens, errors = change_citizens(bulk_id, items)
+        assert errors is None
+        assert [citizen['citizen_id'] for citizen in citizens] == [item['citizen_id'] for item in items]
+        assert Import.get_all_citizens(bulk_id) == Import.get_all_citizens(sequential_id)
+        assert materialized_presents(bulk_id) == recomputed_presents(bulk_id)
+    assert Import.get_version(bulk_id) == 5
+
+
+def test_change_citizens_statements(mocker, queries, large_import_data, recomputed_presents, materialized_presents):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    items = random_items(random.Random(5), [citizen['citizen_id'] for citizen in large_import_data], 50)
+    del queries[:]
+    assert change_citizens(import_id, items)[1] is None
+    assert len(queries) <= 16
+    assert materialized_presents(import_id) == recomputed_presents(import_id)
+
+
+def test_change_citizens_wrong(mocker, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    citizens = Import.get_all_citizens(import_id)
+    valid = {'citizen_id': 1, 'changes': {'town': 'Керчь'}}
+    items = [valid, {'citizen_id': 1, 'changes': {'name': 'Иван'}}, [], {'citizen_id': 2},
+             {'citizen_id': '3', 'changes': {'name': 'Иван'}}, {'citizen_id': 4, 'changes': {}},
+             {'citizen_id': 5, 'changes': {'citizen_id': 6}}, {'citizen_id': 6, 'changes': {'town': None}}]
+    errors = ['duplicate citizen_id', 'invalid item', 'invalid item', 'invalid item', 'invalid changes',
+              'invalid changes', 'invalid changes']
+    assert change_citizens(import_id, items) == (None, [{'index': index, 'error': error}
+                                                        for index, error in enumerate(errors, 1)])
+    items = [valid, {'citizen_id': 61, 'changes': {'name': 'Иван'}}, {'citizen_id': 2, 'changes': {'relatives': [2]}},
+             {'citizen_id': 3, 'changes': {'relatives': [1, 61]}}]
+    errors = ['citizen not found', 'invalid relatives', 'invalid relatives']
+    assert change_citizens(import_id, items) == (None, [{'index': index, 'error': error}
+                                                        for index, error in enumerate(errors, 1)])
+    assert change_citizens(import_id + 1, [valid]) == (None, [{'index': 0, 'error': 'citizen not found'}])
+    assert Import.get_all_citizens(import_id) == citizens
+    assert Import.get_version(import_id) == 0
+
+
+def test_change_citizens_request(mocker, test_client, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    with app.test_request_context():
+        url = url_for('handle_change_citizens_request', import_id=import_id)
+    response = test_client.patch(url, json={'citizens': [{'citizen_id': 2, 'changes': {'relatives': [1]}},
+                                                         {'citizen_id': 1, 'changes': {'town': 'Керчь'}}]})
+    assert response.status_code == 200
+    citizens = serializer.loads(response.data)['data']
+    assert [(citizen['citizen_id'], citizen['relatives']) for citizen in citizens] == [(2, [1]), (1, [2, 60])]
+    assert citizens[1]['town'] == 'Керчь'
+
+    response = test_client.patch(url, json={'citizens': [{'citizen_id': 2, 'changes': {'relatives': [100]}}]})
+    assert response.status_code == 400
+    assert serializer.loads(response.data) == {'errors': [{'index': 0, 'error': 'invalid relatives'}]}
+    for body in ({}, {'citizens': []}, {'citizens': {}}, [1]):
+        assert test_client.patch(url, json=body).status_code == 400
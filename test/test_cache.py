@@ -0,0 +1,42 @@
+from api.cache import LRUStore, ResponseCache
+
+
+class DictStore(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+def test_lru_store_evicts_by_bytes():
+    store = LRUStore(max_bytes=10)
+    store.set('a', b'1234')
+    store.set('b', b'1234')
+    assert store.get('a') == b'1234'
+    store.set('c', b'1234')
+    assert store.get('b') is None
+    assert store.get('a') == store.get('c') == b'1234'
+    assert store.size == 8
+    assert store.evictions == 1
+
+    store.set('too_big', b'12345678901')
+    assert store.get('too_big') is None
+    store.set('a', b'12')
+    assert store.size == 6
+
+
+def test_response_cache_counters():
+    cache = ResponseCache(LRUStore(max_bytes=100))
+    assert cache.get('key') is None
+    cache.set('key', b'{}')
+    assert cache.get('key') == b'{}'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'items': 1, 'bytes': 2, 'max_bytes': 100}
+    cache.clear()
+    assert cache.stats()['items'] == cache.stats()['hits'] == 0
+
+
+def test_response_cache_shared_store():
+    shared = DictStore()
+    ResponseCache(LRUStore(max_bytes=100), shared).set('key', b'{}')
+    cache = ResponseCache(LRUStore(max_bytes=100), shared)
+    assert cache.get('key') == b'{}'
+    assert cache.local.get('key') == b'{}'
+    assert cache.stats()['hits'] == 1
@@ -0,0 +1,17 @@
+from collections import Counter
+
+import pytest
+
+from api.models import Import
+from benchmarks.generator import generate_import
+
+
+@pytest.mark.parametrize('degree', ['uniform', 'power'])
+def test_generate_import(degree):
+    data = generate_import(500, 4, seed=1, degree=degree, towns_count=20, town_skew=1.5)
+    assert data == generate_import(500, 4, seed=1, degree=degree, towns_count=20, town_skew=1.5)
+    assert data != generate_import(500, 4, seed=2, degree=degree, towns_count=20, town_skew=1.5)
+    assert Import.prepare_import(1, data)
+    towns = Counter(citizen['town'] for citizen in data)
+    assert len(towns) <= 20
+    assert towns.most_common(1)[0][1] > len(data) / 5
@@ -0,0 +1,63 @@
+import random
+
+from flask import url_for
+
+from api.wsgi import app
+from api.cache import response_cache
+from api.graph import GraphIndex, count_presents, get_all_citizens, graph_index
+from api.models import Citizen, Import, Relations
+from api.serializer import serializer
+
+
+def test_graph_presents_and_relatives(mocker, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    graph = graph_index.get(import_id)
+    assert graph.relatives_by_citizen() == Relations.get_relatives_by_citizen(import_id)
+    assert count_presents(import_id) == Citizen.count_presents(import_id)
+    assert get_all_citizens(import_id) == Import.get_all_citizens(import_id)
+    assert graph_index.get(import_id) is graph
+
+    rnd = random.Random(3)
+    citizen_ids = [citizen['citizen_id'] for citizen in large_import_data]
+    for _ in range(10):
+        citizen_id = rnd.choice(citizen_ids)
+        assert Citizen.change_data(import_id, citizen_id, {
+            'relatives': rnd.sample([i for i in citizen_ids if i != citizen_id], rnd.randint(0, 5)),
+            'birth_date': '%02d.%02d.1980' % (rnd.randint(1, 28), rnd.randint(1, 12))})
+        assert count_presents(import_id) == Citizen.count_presents(import_id)
+        assert get_all_citizens(import_id) == Import.get_all_citizens(import_id)
+    assert graph_index.get(import_id) is not graph
+
+    assert count_presents(import_id + 1) is None
+    assert get_all_citizens(import_id + 1) is None
+
+
+def test_graph_index_eviction(mocker, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    first_id = Import.create_import(large_import_data)
+    second_id = Import.create_import(large_import_data)
+    index = GraphIndex(graph_index.get(first_id).nbytes)
+    index.get(first_id)
+    index.get(second_id)
+    stats = index.stats()
+    assert list(stats['imports']) == [str(second_id)]
+    assert stats['bytes'] == stats['imports'][str(second_id)]['bytes'] == index.max_bytes
+    assert stats['imports'][str(second_id)]['relations'] == 2 * len(large_import_data)
+
+
+def test_graph_views(mocker, test_client, correct_import_data, correct_presents_response):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(correct_import_data)
+    with app.test_request_context():
+        expected = [test_client.get(url_for(endpoint, import_id=import_id)).data
+                    for endpoint in ('handle_citizens_request', 'handle_birthdays_request')]
+        mocker.patch.dict(app.config, {'GRAPH_INDEX': True})
+        response_cache.clear()
+        response = test_client.get(url_for('handle_birthdays_request', import_id=import_id))
+        assert serializer.loads(response.data)['data'] == correct_presents_response
+        response_cache.clear()
+        assert [test_client.get(url_for(endpoint, import_id=import_id)).data
+                for endpoint in ('handle_citizens_request', 'handle_birthdays_request')] == expected
+        stats = serializer.loads(test_client.get(url_for('handle_graph_stats_request')).data)['data']
+        assert stats['imports'][str(import_id)]['citizens'] == 3
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import select, text
+
+from api.wsgi import db
+from api.models import Citizen, Import, Presents, Relations
+
+
+def explain(statement):
+    """ Возвращает план выполнения statement. В PostgreSQL последовательное чтение отключается,
+        чтобы на маленьких тестовых таблицах план совпадал с планом на больших. """
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return '\n'.join(row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+    if dialect == 'postgresql':
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+        return '\n'.join(row[0] for row in db.session.execute(text('EXPLAIN ' + sql)))
+    pytest.skip('EXPLAIN is not supported for %s' % dialect)
+
+
+def test_age_stat_uses_town_index():
+    assert 'ix_citizens_import_id_town' in explain(Citizen.select_towns_and_birth_dates(1))
+
+
+def is_full_scan(plan):
+    return 'Seq Scan' in plan or any(line.strip().startswith('SCAN') for line in plan.splitlines())
+
+
+def test_reverse_relations_use_relative_index():
+    plan = explain(select(Relations.citizen_id).where(Relations.import_id == 1, Relations.relative_id == 2))
+    assert 'ix_relations_import_id_relative_id' in plan
+    assert not is_full_scan(explain(Relations.delete_relations(1, 2, {3, 4})))
+
+
+def test_presents_deltas_use_citizen_index():
+    plan = explain(select(Presents).where(Presents.import_id == 1, Presents.citizen_id.in_([1, 2])))
+    assert 'ix_presents_import_id_citizen_id' in plan
+
+
+def test_read_queries_avoid_full_scan():
+    for statement in (Relations.select_relations(1), Import.select_citizens(1), Presents.select_presents(1)):
+        assert not is_full_scan(explain(statement))
+
+
+def test_citizens_page_avoids_full_scan():
+    assert not is_full_scan(explain(Import.select_citizens_page(1, ['name'], 100, 5000)))
@@ -0,0 +1,107 @@
+import json
+import logging
+import time
+from datetime import datetime
+
+import pytest
+from flask import url_for
+from sqlalchemy import create_engine
+
+from api.wsgi import app, db
+from api.jobs import execute_job, import_jobs
+from api.models import Import, ImportJob
+from api.serializer import serializer
+
+pytestmark = pytest.mark.usefixtures('jobs_database')
+
+
+@pytest.fixture
+def jobs_database(mocker, tmp_path):
+    """ Задачи фиксируют свой статус отдельными транзакциями, а загрузка в задаче фиксирует выгрузку,
+        поэтому тесты задач работают с временным файлом SQLite вместо базы данных DATABASE_URL. """
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'jobs.db'))
+    db.Model.metadata.create_all(engine)
+    mocker.patch.object(db, 'get_engine', return_value=engine)
+    db.session.remove()
+    yield engine
+    db.session.remove()
+    engine.dispose()
+
+
+def test_execute_job(mocker, large_import_data):
+    mocker.patch('api.models.STREAM_BATCH_SIZE', 25)
+    body = json.dumps({'citizens': large_import_data}).encode()
+    job_id = ImportJob.create_job(len(body))
+    assert ImportJob.get_job(job_id)['status'] == 'queued'
+    import_id = execute_job(job_id, body)
+    assert ImportJob.get_job(job_id) == {'job_id': job_id, 'status': 'done', 'bytes_total': len(body),
+                                         'citizens_processed': 60, 'import_id': import_id}
+    assert Import.get_all_citizens(import_id) == Import.get_all_citizens(Import.create_import(large_import_data))
+
+    job_id = ImportJob.create_job(14)
+    assert execute_job(job_id, b'{"citizens": [') is None
+    assert ImportJob.get_job(job_id)['status'] == 'failed'
+
+
+def test_execute_job_progress(mocker, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    mocker.patch('api.models.STREAM_BATCH_SIZE', 25)
+    mocker.patch('api.jobs.SINGLE_WRITER_DIALECTS', set())
+    update_job = mocker.patch.object(ImportJob, 'update_job')
+    execute_job('job', json.dumps({'citizens': large_import_data}).encode())
+    assert [call.kwargs for call in update_job.call_args_list[:-1]] == [
+        {'status': 'running'}, {'citizens_processed': 25}, {'citizens_processed': 50}, {'citizens_processed': 60}]
+    assert update_job.call_args.kwargs['citizens_processed'] == 60
+
+
+def test_import_job_exception_is_logged(mocker, caplog):
+    mocker.patch('api.models.Import.create_import_stream', side_effect=RuntimeError('database is gone'))
+    job_id = ImportJob.create_job(2)
+    with caplog.at_level(logging.ERROR, logger='api.jobs'):
+        import_jobs.run(job_id, b'{}')
+    assert caplog.records[0].getMessage() == 'Import job %s failed' % job_id
+    assert caplog.records[0].exc_info[0] is RuntimeError
+    assert ImportJob.get_job(job_id)['status'] == 'failed'
+
+
+def test_handle_import_job_request(mocker, test_client, correct_import_data):
+    submit = mocker.patch.object(import_jobs.executor, 'submit')
+    with app.test_request_context():
+        response = test_client.post(url_for('handle_import_request', **{'async': 1}),
+                                    json={'citizens': correct_import_data})
+        assert response.status_code == 202
+        job_id = serializer.loads(response.data)['data']['job_id']
+        assert response.headers['Location'].endswith(url_for('handle_import_job_request', job_id=job_id))
+        assert submit.call_count == 1
+
+        response = test_client.get(url_for('handle_import_job_request', job_id=job_id))
+        assert serializer.loads(response.data)['data']['status'] == 'queued'
+        execute_job(*submit.call_args.args[1:])
+        data = serializer.loads(test_client.get(url_for('handle_import_job_request', job_id=job_id)).data)['data']
+        assert data['status'] == 'done'
+        assert data['citizens_processed'] == 3
+        assert Import.get_all_citizens(data['import_id'])[0]['relatives'] == [2, 3]
+
+        response = test_client.get(url_for('handle_import_job_request', job_id='unknown'))
+        assert response.status_code == 400
+
+
+def test_forget_finished_jobs(mocker):
+    mocker.patch('api.jobs.MAX_FINISHED_JOBS', 2)
+    mocker.patch.object(import_jobs.executor, 'submit')
+    jobs = [import_jobs.submit(b'{}')['job_id'] for _ in range(4)]
+    for second, job_id in enumerate(jobs[:3]):
+        ImportJob.update_job(job_id, status='done', finished_at=datetime(2019, 8, 1, 0, 0, second))
+    import_jobs.submit(b'{}')
+    assert [ImportJob.get_job(job_id) is not None for job_id in jobs] == [False, True, True, True]
+
+
+def test_import_job_thread(test_client, correct_import_data):
+    job_id = import_jobs.submit(json.dumps({'citizens': correct_import_data}).encode())['job_id']
+    deadline = time.time() + 30
+    while ImportJob.get_job(job_id)['status'] in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.05)
+        db.session.commit()
+    job = ImportJob.get_job(job_id)
+    assert job['status'] == 'done'
+    assert Import.get_all_citizens(job['import_id'])[1]['relatives'] == [1]
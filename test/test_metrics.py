@@ -0,0 +1,48 @@
+import logging
+
+from flask import url_for
+
+from api.wsgi import app
+from api.metrics import Histogram, metrics
+from api.models import Import
+
+
+def test_histogram_render():
+    histogram = Histogram('test_seconds', 'Test.', (0.1, 1))
+    histogram.observe((('route', '/a'),), 0.05)
+    histogram.observe((('route', '/a'),), 0.5)
+    histogram.observe((('route', '/a'),), 5)
+    assert histogram.render() == ['# HELP test_seconds Test.',
+                                  '# TYPE test_seconds histogram',
+                                  'test_seconds_bucket{route="/a",le="0.1"} 1',
+                                  'test_seconds_bucket{route="/a",le="1"} 2',
+                                  'test_seconds_bucket{route="/a",le="+Inf"} 3',
+                                  'test_seconds_sum{route="/a"} 5.55',
+                                  'test_seconds_count{route="/a"} 3']
+
+
+def test_metrics_request(mocker, test_client, correct_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    metrics.clear()
+    import_id = Import.create_import(correct_import_data)
+    with app.test_request_context():
+        route = url_for('handle_citizens_request', import_id=import_id)
+        response = test_client.get(route)
+        body = test_client.get(url_for('handle_metrics_request')).data.decode()
+    labels = 'method="GET",route="/imports/<import_id>/citizens"'
+    assert 'http_request_duration_seconds_count{%s,status="200"} 1' % labels in body
+    assert 'http_request_sql_queries_sum{%s} 3' % labels in body
+    assert 'http_request_sql_queries_count{%s} 1' % labels in body
+    assert 'http_response_size_bytes_sum{%s} %d' % (labels, len(response.data)) in body
+
+
+def test_slow_request_log(mocker, test_client, caplog, correct_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    mocker.patch.object(metrics, 'slow_request_seconds', 0)
+    import_id = Import.create_import(correct_import_data)
+    with app.test_request_context(), caplog.at_level(logging.WARNING, logger='api.slow_requests'):
+        test_client.get(url_for('handle_birthdays_request', import_id=import_id))
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert message.startswith('GET /imports/%d/citizens/birthdays' % import_id)
+    assert 'FROM presents' in message
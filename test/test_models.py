@@ -1,4 +1,12 @@
-from api.models import REQUIRED_FIELDS, Citizen, Import, Relations
+import random
+from datetime import date
+
+import numpy
+from sqlalchemy.dialects import postgresql
+
+from api.wsgi import db, db_worker
+from api.graph import RelativesGraph
+from api.models import REQUIRED_FIELDS, Citizen, Import, Presents, Relations
 
 
 def test_citizen_as_dict(mocker, citizen):
@@ -10,7 +18,7 @@ def test_citizen_as_dict(mocker, citizen):
     assert type(data['building']) is str
     assert data['gender'] in {'male', 'female'}
     assert data['relatives'] == [2, 3]
-    assert data['birth_date'] == "26.12.1986"
+    assert data['birth_date'] == date(1986, 12, 26)
     assert type(data['citizen_id']) is int
     assert type(data['apartment']) is int
 
@@ -34,10 +42,8 @@ def test_change_data_ok(mocker, import_id, correct_citizen_data):
         "town": "Новосибирск",
         "apartment": 9,
         "birth_date": '23.12.1999'})
-    assert citizen
-    assert citizen.name == "Иванова Мария Леонидовна"
-    assert citizen.town == "Новосибирск"
-    assert citizen.apartment == 9
+    assert citizen == dict(correct_citizen_data, name="Иванова Мария Леонидовна", town="Новосибирск", apartment=9,
+                           birth_date=date(1999, 12, 23), relatives=[])
 
 
 def test_change_data_wrong(import_id, correct_citizen_data):
@@ -102,6 +108,8 @@ def test_get_all_citizens(import_id, correct_citizen_data):
         if key == 'relatives':
             for relative in value:
                 assert relative in correct_citizen_data[key]
+        elif key == 'birth_date':
+            assert value.strftime('%d.%m.%Y') == correct_citizen_data[key]
         else:
             assert value == correct_citizen_data[key]
 
@@ -113,13 +121,37 @@ def test_get_all_citizens(import_id, correct_citizen_data):
 
 def test_create_import(mocker, import_id, correct_import_data, correct_citizen_data, incorrect_relatives_import_data):
     mocker.patch('api.database_worker.DataBaseWorker.commit')
-    assert Import.create_import(correct_import_data) == import_id
-    assert len(Import.get_all_citizens(import_id)) == len(correct_import_data)
+    new_import_id = Import.create_import(correct_import_data)
+    assert new_import_id > import_id
+    assert len(Import.get_all_citizens(new_import_id)) == len(correct_import_data)
+    assert Import.query.get(new_import_id).citizens_count == len(correct_import_data)
+    assert Import.query.get(new_import_id).created_at
     assert not Import.create_import([])
     assert not Import.create_import([correct_citizen_data, {}])
     assert Import.create_import([correct_citizen_data])
     assert not Import.create_import(incorrect_relatives_import_data)
-    assert Import.get_new_import_id() == import_id
+    assert not Import.query.get(new_import_id)
+
+
+def test_select_months_locks_citizens(mocker, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    execute = mocker.spy(db_worker, 'execute')
+    assert Citizen.select_months(import_id, {3, 1, 2}) == {1: 2, 2: 3, 3: 4}
+    sql = str(execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert sql.endswith('ORDER BY citizens.citizen_id FOR UPDATE')
+
+
+def test_change_data_locks_relatives(mocker, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    execute = mocker.spy(db_worker, 'execute')
+    assert Citizen.change_data(import_id, 5, {'birth_date': '01.02.1990', 'relatives': [3, 1]})
+    locks = [call.args[0].compile(dialect=postgresql.dialect()) for call in execute.call_args_list
+             if call.args[0].is_select and call.args[0]._for_update_arg is not None]
+    assert [sorted(next(value for value in lock.params.values() if type(value) in (list, set))) for lock in locks] == \
+        [[1, 3, 5], [4, 6]]
+    assert all(str(lock).endswith('ORDER BY citizens.citizen_id FOR UPDATE') for lock in locks)
 
 
 def test_change_relatives(mocker, correct_import_data):
@@ -139,10 +171,212 @@ def test_change_relatives(mocker, correct_import_data):
     assert another_citizen_id in Relations.get_all_relatives_id(import_id, citizen_id)
 
 
-def test_count_presents(mocker, correct_import_data, correct_presents_response, correct_age_stat_response):
+def test_count_presents(mocker, today, correct_import_data, correct_presents_response, correct_age_stat_response):
     mocker.patch('api.database_worker.DataBaseWorker.commit')
     import_id = Import.create_import(correct_import_data)
     presents = Citizen.count_presents(import_id)
     assert presents == correct_presents_response
     assert Citizen.get_age_stat(import_id) == correct_age_stat_response
     assert not Citizen.count_presents(-54)
+
+
+def test_prepare_import(correct_import_data):
+    citizens, relations = Import.prepare_import(1, correct_import_data)
+    assert len(citizens) == len(correct_import_data)
+    assert citizens[0]['birth_date'] == date(1986, 12, 26)
+    assert 'relatives' not in citizens[0]
+    assert {(relation['citizen_id'], relation['relative_id']) for relation in relations} == \
+        {(1, 2), (1, 3), (2, 1), (3, 1)}
+
+    assert not Import.prepare_import(1, correct_import_data + [correct_import_data[0]])
+    correct_import_data[1]['relatives'] = [1, 2]
+    assert not Import.prepare_import(1, correct_import_data)
+    correct_import_data[1]['relatives'] = [1, 4]
+    assert not Import.prepare_import(1, correct_import_data)
+
+
+def test_count_presents_queries(mocker, queries, correct_import_data, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    small_import_id = Import.create_import(correct_import_data)
+    large_import_id = Import.create_import(large_import_data)
+
+    del queries[:]
+    Citizen.count_presents(small_import_id)
+    small_import_queries = len(queries)
+    del queries[:]
+    presents = Citizen.count_presents(large_import_id)
+    assert len(queries) == small_import_queries == 1
+    assert sum(item['presents'] for month in presents.values() for item in month) == 2 * len(large_import_data)
+    assert [item['citizen_id'] for item in presents['2']] == [2, 60, 12, 14, 24, 26, 36, 38, 48, 50]
+
+
+def test_get_all_citizens_queries(mocker, queries, correct_import_data, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    small_import_id = Import.create_import(correct_import_data)
+    large_import_id = Import.create_import(large_import_data)
+
+    del queries[:]
+    assert [citizen['relatives'] for citizen in Import.get_all_citizens(small_import_id)] == [[2, 3], [1], [1]]
+    small_import_queries = len(queries)
+    del queries[:]
+    citizens = Import.get_all_citizens(large_import_id)
+    assert len(queries) == small_import_queries == 2
+    assert citizens[0]['relatives'] == [2, 60]
+    assert citizens[0] == Citizen.get_citizen(large_import_id, 1).as_dict()
+
+
+def test_iter_citizens(mocker, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    assert list(Import.iter_citizens(import_id)) == Import.get_all_citizens(import_id)
+    assert not list(Import.iter_citizens(import_id + 1))
+
+
+def test_get_age_stat(mocker, today, correct_import_data, correct_age_stat_response):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(correct_import_data)
+    assert Citizen.get_age_stat(import_id) == correct_age_stat_response
+
+    today.current = date(2019, 12, 26)
+    assert Citizen.get_age_stat(import_id)[0]['p99'] == 33.0
+
+    Citizen.change_data(import_id, 2, {'town': 'Тамбов'})
+    assert [stat['town'] for stat in Citizen.get_age_stat(import_id)] == ['Москва', 'Тамбов']
+    assert Citizen.get_age_stat(-54) == []
+
+
+def test_calculate_ages(today):
+    birth_dates = [date(1986, 12, 26), date(1997, 4, 17), date(2000, 2, 29), date(2000, 8, 1), date(2000, 8, 2)]
+    ages = Citizen.calculate_ages(numpy.array(birth_dates, dtype='datetime64[D]'), today.current)
+    assert list(ages) == [Citizen.calculate_age(birth_date) for birth_date in birth_dates]
+
+
+def test_presents_incremental(mocker, large_import_data, recomputed_presents, materialized_presents):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    assert materialized_presents(import_id) == recomputed_presents(import_id)
+
+    rnd = random.Random(7)
+    citizen_ids = [citizen['citizen_id'] for citizen in large_import_data]
+    for _ in range(40):
+        citizen_id = rnd.choice(citizen_ids)
+        changes = dict()
+        if rnd.random() < 0.6:
+            changes['relatives'] = rnd.sample([i for i in citizen_ids if i != citizen_id], rnd.randint(0, 5))
+        if rnd.random() < 0.6:
+            changes['birth_date'] = '%02d.%02d.1980' % (rnd.randint(1, 28), rnd.randint(1, 12))
+        if not changes:
+            changes['name'] = 'Петров Петр Петрович'
+        items = list(changes.items())
+        rnd.shuffle(items)
+        assert Citizen.change_data(import_id, citizen_id, dict(items))
+        assert materialized_presents(import_id) == recomputed_presents(import_id)
+        assert Citizen.count_presents(import_id) == \
+            Citizen.presents_rows_to_dict(RelativesGraph.load(import_id, None).presents_rows())
+
+
+def test_apply_deltas_adds_in_database(mocker, large_import_data, materialized_presents):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    presents = materialized_presents(import_id)
+    assert presents[(2, 2)] == presents[(4, 2)] == 1 and (5, 2) not in presents
+    # Строка уже загружена в сессию, а другая транзакция добавляет в нее подарок.
+    Presents.query.filter_by(import_id=import_id, month=2, citizen_id=2).one()
+    table = Presents.__table__
+    db.session.execute(table.update().where(table.c.import_id == import_id, table.c.month == 2,
+                                            table.c.citizen_id == 2).values(presents=table.c.presents + 1))
+
+    Presents.apply_deltas(import_id, {(2, 2): 1, (4, 2): -1, (5, 2): 1, (6, 2): 0})
+    presents[(2, 2)] = 3
+    presents[(5, 2)] = 1
+    del presents[(4, 2)]
+    assert materialized_presents(import_id) == presents
+
+
+def test_update_relations_statements(mocker, queries, large_import_data, recomputed_presents, materialized_presents):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    new_relatives = list(range(3, 53))
+
+    del queries[:]
+    months = {citizen_id: (citizen_id % 12) + 1 for citizen_id in range(1, 61)}
+    months[1] = 2
+    deltas = Relations.update_relations(import_id, 1, Relations.get_all_relatives_id(import_id, 1), new_relatives,
+                                        months)
+    Presents.apply_deltas(import_id, deltas)
+    db.session.flush()
+    assert len(queries) <= 6
+    assert Relations.get_all_relatives_id(import_id, 1) == new_relatives
+    assert 1 not in Relations.get_all_relatives_id(import_id, 60)
+    assert all(1 in Relations.get_all_relatives_id(import_id, relative_id) for relative_id in new_relatives)
+    assert materialized_presents(import_id) == recomputed_presents(import_id)
+
+
+def test_create_import_stream(mocker, large_import_data, materialized_presents):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    mocker.patch('api.models.STREAM_BATCH_SIZE', 7)
+    import_id = Import.create_import(large_import_data)
+    stream_import_id = Import.create_import_stream(iter(large_import_data))
+    assert Import.get_all_citizens(stream_import_id) == Import.get_all_citizens(import_id)
+    assert materialized_presents(stream_import_id) == materialized_presents(import_id)
+    assert Import.query.get(stream_import_id).citizens_count == len(large_import_data)
+
+
+def test_create_import_stream_wrong(mocker, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    mocker.patch('api.models.STREAM_BATCH_SIZE', 7)
+
+    def invalid_stream():
+        yield from large_import_data[:30]
+        raise ValueError('Unexpected end of stream')
+
+    asymmetric = [dict(citizen) for citizen in large_import_data]
+    asymmetric[-1]['relatives'] = asymmetric[-1]['relatives'][:1]
+    duplicated = large_import_data + large_import_data[:1]
+    self_relative = [dict(citizen) for citizen in large_import_data]
+    self_relative[40]['relatives'] = self_relative[40]['relatives'] + [41]
+    invalid_field = [dict(citizen) for citizen in large_import_data]
+    invalid_field[50]['apartment'] = '7'
+    citizens_count = Citizen.query.count()
+    for data in (iter([]), invalid_stream(), iter(asymmetric), iter(duplicated), iter(self_relative),
+                 iter(invalid_field)):
+        assert Import.create_import_stream(data) is None
+        assert Citizen.query.count() == citizens_count
+
+
+def test_reads_do_not_load_orm_objects(mocker, today, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    db.session.expunge_all()
+    assert len(Import.get_all_citizens(import_id)) == len(large_import_data)
+    assert list(Import.iter_citizens(import_id)) == Import.get_all_citizens(import_id)
+    assert Citizen.count_presents(import_id)
+    assert Citizen.get_age_stat(import_id)
+    assert Relations.get_all_relatives_id(import_id, 1) == [2, 60]
+    assert not db.session.identity_map
+
+
+def test_get_citizens_page(mocker, queries, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    citizens = Import.get_all_citizens(import_id)
+
+    pages, cursor = [], None
+    while True:
+        del queries[:]
+        page, cursor = Import.get_citizens_page(import_id, limit=7, after=cursor)
+        assert len(queries) == 2
+        pages.extend(page)
+        if cursor is None:
+            break
+    assert pages == citizens
+
+    del queries[:]
+    page, cursor = Import.get_citizens_page(import_id, {'name', 'citizen_id'}, limit=5, after=50)
+    assert page == [{'citizen_id': citizen['citizen_id'], 'name': citizen['name']} for citizen in citizens[50:55]]
+    assert cursor == 55
+    assert len(queries) == 1
+    assert 'birth_date' not in queries[0] and 'LIMIT' in queries[0]
+
+    assert Import.get_citizens_page(import_id, limit=5, after=60) == ([], None)
+    assert Import.get_citizens_page(import_id + 1, limit=5) is None
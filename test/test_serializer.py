@@ -0,0 +1,38 @@
+from datetime import date
+
+import pytest
+
+from api.serializer import SERIALIZERS, get_serializer
+
+
+@pytest.fixture(params=sorted(SERIALIZERS))
+def serializer(request):
+    return get_serializer(request.param)
+
+
+def test_dumps_dates(serializer, citizen):
+    data = serializer.loads(serializer.dumps({'data': [citizen.as_dict([2, 3])]}))
+    assert data['data'][0]['birth_date'] == '26.12.1986'
+    assert data['data'][0]['name'] == 'Иванов Иван Иванович'
+    assert 'Иванов'.encode() in serializer.dumps(citizen.as_dict([]))
+    with pytest.raises(TypeError):
+        serializer.dumps({'data': object()})
+
+
+def test_loads(serializer, correct_import_data):
+    body = serializer.dumps({'citizens': correct_import_data})
+    assert serializer.loads(body) == {'citizens': correct_import_data}
+    with pytest.raises(ValueError):
+        serializer.loads(b'')
+    with pytest.raises(ValueError):
+        serializer.loads(b'{"citizens": [')
+
+
+@pytest.mark.parametrize('items', [[], [1], [{'birth_date': date(2000, 1, 2)}, 'Тамбов', [3]]])
+def test_iter_dumps_list(serializer, items):
+    assert b''.join(serializer.iter_dumps_list('data', iter(items))) == serializer.dumps({'data': items})
+
+
+def test_get_serializer():
+    assert get_serializer('json').name == 'json'
+    assert get_serializer('auto').name in SERIALIZERS
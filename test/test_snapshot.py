@@ -0,0 +1,75 @@
+import io
+
+import numpy
+from flask import url_for
+
+from api.wsgi import app
+from api.models import Citizen, Import
+from api.serializer import serializer
+from api.snapshot import export_import, restore_import
+
+
+def test_snapshot_round_trip(mocker, today, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    snapshot = export_import(import_id)
+    restored_id = restore_import(io.BytesIO(snapshot))
+    assert restored_id != import_id
+    assert Import.get_all_citizens(restored_id) == Import.get_all_citizens(import_id)
+    assert Citizen.count_presents(restored_id) == Citizen.count_presents(import_id)
+    assert Citizen.get_age_stat(restored_id) == Citizen.get_age_stat(import_id)
+    assert Import.query.get(restored_id).citizens_count == len(large_import_data)
+    assert export_import(restored_id) == snapshot
+    assert export_import(restored_id + 1) is None
+
+
+def changed_snapshot(snapshot, **arrays):
+    with numpy.load(io.BytesIO(snapshot), allow_pickle=False) as loaded:
+        data = dict(loaded)
+    data.update(arrays)
+    changed = io.BytesIO()
+    numpy.savez(changed, **data)
+    changed.seek(0)
+    return changed
+
+
+def test_restore_invalid_snapshot(mocker, correct_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    snapshot = export_import(Import.create_import(correct_import_data))
+    citizens_count = Citizen.query.count()
+    for invalid in (io.BytesIO(b'not a snapshot'),
+                    changed_snapshot(snapshot, version=numpy.array(2)),
+                    changed_snapshot(snapshot, citizen_id=numpy.array([1, 1, 3])),
+                    changed_snapshot(snapshot, apartment=numpy.array([7, 7])),
+                    changed_snapshot(snapshot, apartment=numpy.array(['7', '7', '11'])),
+                    changed_snapshot(snapshot, town_values=numpy.array([''])),
+                    changed_snapshot(snapshot, town_codes=numpy.array([0, 0, 1])),
+                    changed_snapshot(snapshot, town_codes=numpy.array([0, 0, -1])),
+                    changed_snapshot(snapshot, gender_values=numpy.array(['female', 'other'])),
+                    changed_snapshot(snapshot, gender_values=numpy.array([{'a': 1}], dtype=object)),
+                    changed_snapshot(snapshot, birth_date=numpy.array(['2000-01-01', 'NaT', '2000-01-01'],
+                                                                      dtype='datetime64[D]')),
+                    changed_snapshot(snapshot, relations=numpy.array([[1, 2], [3, 1]])),
+                    changed_snapshot(snapshot, relations=numpy.array([[1, 4]])),
+                    changed_snapshot(snapshot, relations=numpy.array([1, 2]))):
+        assert restore_import(invalid) is None
+    assert Citizen.query.count() == citizens_count
+
+
+def test_snapshot_views(mocker, test_client, correct_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(correct_import_data)
+    with app.test_request_context():
+        response = test_client.get(url_for('handle_snapshot_export_request', import_id=import_id))
+        assert response.status_code == 200
+        assert response.headers['Content-Disposition'] == 'attachment; filename=import-%d.npz' % import_id
+        response = test_client.post(url_for('handle_snapshot_import_request'), data=response.data,
+                                    content_type='application/octet-stream')
+        assert response.status_code == 201
+        restored_id = serializer.loads(response.data)['data']['import_id']
+        assert Import.get_all_citizens(restored_id) == Import.get_all_citizens(import_id)
+
+        response = test_client.get(url_for('handle_snapshot_export_request', import_id=restored_id + 1))
+        assert response.status_code == 400
+        response = test_client.post(url_for('handle_snapshot_import_request'), data=b'{}')
+        assert response.status_code == 400
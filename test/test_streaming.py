@@ -0,0 +1,42 @@
+import io
+import json
+
+import pytest
+
+from api import streaming
+from api.streaming import JsonStreamReader, iter_import_citizens
+
+
+def test_iter_import_citizens(large_import_data):
+    body = json.dumps({'before': [1.5, {'a': 'б'}], 'citizens': large_import_data, 'after': 12345},
+                      ensure_ascii=False).encode()
+    for chunk_size in (1, 3, 64, len(body)):
+        assert list(iter_import_citizens(io.BytesIO(body), chunk_size=chunk_size)) == large_import_data
+
+
+def test_read_value_split_number():
+    reader = JsonStreamReader(io.BytesIO(b'[12345, 6789]'), 3)
+    assert list(reader.iter_array()) == [12345, 6789]
+
+
+def test_iter_import_citizens_split_floats():
+    body = b'{"citizens": [1], "y": 1.5e3, "z": [-2.25E-1, 10]}'
+    for chunk_size in range(1, len(body) + 1):
+        assert list(iter_import_citizens(io.BytesIO(body), chunk_size=chunk_size)) == [1]
+
+
+@pytest.mark.parametrize('body', [b'', b'{}', b'[]', b'{"citizens": {}}', b'{"citizens": [1, 2',
+                                  b'{"citizens": [1 2]}', b'{"citizens": [], "citizens": []}',
+                                  b'{"citizens": []} []', b'{"other": []}', b'{"citizens": ["\xff"]}'])
+def test_iter_import_citizens_invalid(body):
+    with pytest.raises(ValueError):
+        list(iter_import_citizens(io.BytesIO(body)))
+
+
+def test_max_value_size(mocker):
+    mocker.patch.object(streaming, 'MAX_VALUE_SIZE', 100)
+    body = json.dumps({'citizens': ['x' * 50, 'y' * 200]}).encode()
+    citizens = iter_import_citizens(io.BytesIO(body), chunk_size=16)
+    assert next(citizens) == 'x' * 50
+    with pytest.raises(ValueError):
+        next(citizens)
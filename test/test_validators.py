@@ -0,0 +1,65 @@
+from datetime import date
+
+from hypothesis import given, settings, strategies as st
+
+from api.validators import REQUIRED_FIELDS, parse_citizen, parse_citizens
+
+
+def reference_is_data_valid(data):
+    """ Прежняя реализация Citizen.is_data_valid, с которой сверяется parse_citizen. """
+    if not data or type(data) is not dict:
+        return False
+    for value in data.values():
+        if value is None:
+            return False
+    if ('citizen_id' in data.keys() and type(data['citizen_id']) is not int) \
+            or ('apartment' in data.keys() and type(data['apartment']) is not int):
+        return False
+    for field in REQUIRED_FIELDS - {'citizen_id', 'apartment', 'relatives'}:
+        if field in data.keys() and (type(data[field]) is not str or not data[field]):
+            return False
+    if 'gender' in data.keys() and data['gender'] not in {'male', 'female'}:
+        return False
+    if 'birth_date' in data.keys():
+        try:
+            date(*reversed([int(x) for x in data['birth_date'].split('.')]))
+        except (ValueError, TypeError):
+            return False
+    if 'relatives' in data.keys():
+        if type(data['relatives']) is not list:
+            return False
+        for relative_id in data['relatives']:
+            if type(relative_id) is not int:
+                return False
+    return True
+
+
+date_parts = st.one_of(st.integers(-1, 10000).map(str), st.sampled_from(['', ' 7', '07', '+3', '1_0', 'x', '٣']))
+dates = st.lists(date_parts, min_size=0, max_size=4).map('.'.join)
+values = st.one_of(st.none(), st.booleans(), st.integers(), st.floats(allow_nan=False), st.text(max_size=5),
+                   dates, st.sampled_from(['male', 'female']),
+                   st.lists(st.one_of(st.integers(), st.booleans(), st.text(max_size=2)), max_size=3))
+citizens = st.one_of(st.dictionaries(st.sampled_from(sorted(REQUIRED_FIELDS) + ['extra']), values),
+                     st.none(), st.integers(), st.lists(st.integers(), max_size=2))
+
+
+@settings(max_examples=1000, deadline=None)
+@given(citizens)
+def test_parse_citizen_matches_reference(data):
+    assert (parse_citizen(data) is not None) == reference_is_data_valid(data)
+
+
+@settings(deadline=None)
+@given(st.lists(citizens, max_size=4))
+def test_parse_citizens_matches_reference(data):
+    accepted = all(reference_is_data_valid(citizen) and citizen.keys() == REQUIRED_FIELDS for citizen in data)
+    assert (parse_citizens(data) is not None) == accepted
+
+
+def test_parse_citizen(correct_citizen_data):
+    citizen = parse_citizen(correct_citizen_data)
+    assert citizen['birth_date'] == date(1986, 12, 26)
+    assert citizen['relatives'] == correct_citizen_data['relatives']
+    assert correct_citizen_data['birth_date'] == '26.12.1986'
+    assert parse_citizens([correct_citizen_data, correct_citizen_data])[1]['birth_date'] == date(1986, 12, 26)
+    assert parse_citizens([correct_citizen_data, {'citizen_id': 2}]) is None
@@ -1,8 +1,11 @@
-import json
+from datetime import date
 
 from flask import url_for
 
-from api.wsgi import app
+from api.wsgi import app, db
+from api.cache import response_cache
+from api.models import Citizen, Import
+from api.serializer import serializer
 
 
 def test_handle_import_request_ok(mocker, test_client, import_id):
@@ -10,7 +13,7 @@ def test_handle_import_request_ok(mocker, test_client, import_id):
     with app.test_request_context():
         response = test_client.post(url_for('handle_import_request'), json={'citizens': []})
         assert response.status_code == 201
-        assert response.data.decode() == '{"data": {"import_id": %d}}' % import_id
+        assert response.data == serializer.dumps({'data': {'import_id': import_id}})
 
 
 def test_handle_import_request_400(test_client):
@@ -29,14 +32,29 @@ def test_handle_import_request_wrong_data(mocker, test_client, incorrect_relativ
         assert response.status_code == 400
 
 
-def test_handle_change_citizen_request_ok(mocker, test_client, citizen, correct_citizen_data):
-    mocker.patch('api.models.Citizen.change_data', return_value=citizen)
-    mocker.patch('api.models.Citizen.as_dict', return_value=correct_citizen_data)
+def test_handle_change_citizen_request_ok(mocker, test_client, correct_citizen_data):
+    mocker.patch('api.models.Citizen.change_data', return_value=correct_citizen_data)
     with app.test_request_context():
         response = test_client.patch(url_for('handle_change_citizen_request', import_id=1, citizen_id=1),
                                      json={'citizens': []})
         assert response.status_code == 200
-        assert response.data.decode() == json.dumps(correct_citizen_data, ensure_ascii=False)
+        assert response.data == serializer.dumps(correct_citizen_data)
+
+
+def test_handle_change_citizen_request_queries(mocker, queries, test_client, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    with app.test_request_context():
+        url = url_for('handle_change_citizen_request', import_id=import_id, citizen_id=5)
+    del queries[:]
+    response = test_client.patch(url, json={'name': 'Петров Петр', 'birth_date': '01.02.1990', 'relatives': [3, 1]})
+    assert response.status_code == 200
+    citizen = serializer.loads(response.data)
+    assert (citizen['name'], citizen['birth_date'], citizen['relatives']) == ('Петров Петр', '01.02.1990', [1, 3])
+    assert len(queries) <= 11
+    assert sum(statement.startswith('SELECT citizens.import_id') for statement in queries) == 1
+    assert queries[-1].startswith('UPDATE imports')
+    assert citizen == serializer.loads(serializer.dumps(Import.get_all_citizens(import_id)[4]))
 
 
 def test_handle_change_citizen_request_400(mocker, test_client):
@@ -54,7 +72,7 @@ def test_handle_citizen_request_ok(mocker, test_client, correct_import_data):
     with app.test_request_context():
         response = test_client.get(url_for('handle_citizens_request', import_id=1))
         assert response.status_code == 200
-        assert response.data.decode() == json.dumps({'data': correct_import_data}, ensure_ascii=False)
+        assert response.data == serializer.dumps({'data': correct_import_data})
 
 
 def test_handle_citizen_request_400(mocker, test_client):
@@ -69,7 +87,7 @@ def test_birthdays_request_ok(mocker, test_client, correct_presents_response):
     with app.test_request_context():
         response = test_client.get(url_for('handle_birthdays_request', import_id=1))
         assert response.status_code == 200
-        assert response.data.decode() == json.dumps({'data': correct_presents_response}, ensure_ascii=False)
+        assert response.data == serializer.dumps({'data': correct_presents_response})
 
 
 def test_birthdays_request_400(mocker, test_client, ):
@@ -84,7 +102,7 @@ def test_handle_age_stat_request_ok(mocker, test_client, correct_age_stat_respon
     with app.test_request_context():
         response = test_client.get(url_for('handle_age_stat_request', import_id=1))
         assert response.status_code == 200
-        assert response.data.decode() == json.dumps({'data': correct_age_stat_response}, ensure_ascii=False)
+        assert response.data == serializer.dumps({'data': correct_age_stat_response})
 
 
 def test_handle_age_stat_request_400(mocker, test_client):
@@ -92,3 +110,113 @@ def test_handle_age_stat_request_400(mocker, test_client):
     with app.test_request_context():
         response = test_client.get(url_for('handle_age_stat_request', import_id=1))
         assert response.status_code == 400
+
+
+def test_handle_citizen_request_stream(mocker, test_client, correct_import_data):
+    mocker.patch.dict(app.config, {'STREAM_CITIZENS': True})
+    mocker.patch('api.models.Import.iter_citizens', return_value=iter(correct_import_data))
+    with app.test_request_context():
+        response = test_client.get(url_for('handle_citizens_request', import_id=1))
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.data == serializer.dumps({'data': correct_import_data})
+
+    mocker.patch('api.models.Import.iter_citizens', return_value=iter([]))
+    with app.test_request_context():
+        response = test_client.get(url_for('handle_citizens_request', import_id=1))
+        assert response.status_code == 400
+
+
+def test_handle_import_request_invalid_json(test_client):
+    with app.test_request_context():
+        response = test_client.post(url_for('handle_import_request'), data=b'{"citizens": [',
+                                    content_type='application/json')
+        assert response.status_code == 400
+        response = test_client.post(url_for('handle_import_request'), json=[1, 2])
+        assert response.status_code == 400
+
+
+def test_birthdays_request_etag(mocker, test_client, correct_import_data, correct_presents_response):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(correct_import_data)
+    count_presents = mocker.spy(Citizen, 'count_presents')
+    with app.test_request_context():
+        url = url_for('handle_birthdays_request', import_id=import_id)
+    response = test_client.get(url)
+    assert response.status_code == 200
+    assert serializer.loads(response.data) == {'data': correct_presents_response}
+    etag = response.headers['ETag']
+
+    assert test_client.get(url).data == response.data
+    assert count_presents.call_count == 1
+    assert response_cache.stats()['hits'] == 1
+    not_modified = test_client.get(url, headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not not_modified.data
+
+    Citizen.change_data(import_id, 2, {'birth_date': '17.05.1997'})
+    response = test_client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert serializer.loads(response.data)['data']['5'] == [{'citizen_id': 1, 'presents': 1}]
+    assert count_presents.call_count == 2
+
+
+def test_age_stat_request_sees_other_process_changes(mocker, test_client, today, correct_import_data,
+                                                     correct_age_stat_response):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(correct_import_data)
+    with app.test_request_context():
+        url = url_for('handle_age_stat_request', import_id=import_id)
+    response = test_client.get(url)
+    assert serializer.loads(response.data) == {'data': correct_age_stat_response}
+
+    # Так изменение выполняет другой воркер: в этом процессе ничего не сбрасывается.
+    table = Citizen.__table__
+    db.session.execute(table.update().where(table.c.import_id == import_id, table.c.citizen_id == 1)
+                       .values(birth_date=date(2003, 1, 1)))
+    Import.bump_version(import_id)
+    response = test_client.get(url)
+    assert response.headers['ETag'].startswith('"%d-1-' % import_id)
+    assert serializer.loads(response.data) == {'data': Citizen.get_age_stat(import_id)}
+    assert serializer.loads(response.data) != {'data': correct_age_stat_response}
+
+
+def test_cache_stats_request(test_client):
+    with app.test_request_context():
+        response = test_client.get(url_for('handle_cache_stats_request'))
+        assert response.status_code == 200
+        assert serializer.loads(response.data)['data']['misses'] == 0
+
+
+def test_handle_import_request_stream(mocker, test_client, correct_import_data):
+    mocker.patch.dict(app.config, {'STREAM_IMPORTS': True})
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    with app.test_request_context():
+        response = test_client.post(url_for('handle_import_request'), json={'citizens': correct_import_data})
+        assert response.status_code == 201
+        import_id = serializer.loads(response.data)['data']['import_id']
+        assert Import.get_all_citizens(import_id)[0]['relatives'] == [2, 3]
+
+        response = test_client.post(url_for('handle_import_request'), data=b'{"citizens": [',
+                                    content_type='application/json')
+        assert response.status_code == 400
+
+
+def test_handle_citizens_request_page(mocker, test_client, large_import_data):
+    mocker.patch('api.database_worker.DataBaseWorker.commit')
+    import_id = Import.create_import(large_import_data)
+    with app.test_request_context():
+        response = test_client.get(url_for('handle_citizens_request', import_id=import_id, limit=2, cursor=10,
+                                           fields='citizen_id,relatives'))
+        assert response.status_code == 200
+        assert serializer.loads(response.data) == {'data': [{'citizen_id': 11, 'relatives': [10, 12]},
+                                                            {'citizen_id': 12, 'relatives': [11, 13]}],
+                                                   'next_cursor': 12}
+        response = test_client.get(url_for('handle_citizens_request', import_id=import_id, fields='name'))
+        assert len(serializer.loads(response.data)['data']) == len(large_import_data)
+        for args in ({'limit': 0}, {'limit': 'a'}, {'cursor': 'a'}, {'fields': 'name,password'}, {'fields': ''}):
+            response = test_client.get(url_for('handle_citizens_request', import_id=import_id, **args))
+            assert response.status_code == 400
+        response = test_client.get(url_for('handle_citizens_request', import_id=import_id + 1, limit=10))
+        assert response.status_code == 400